@@ -0,0 +1,125 @@
+"""Cold-start import time of the stigmapyze entry points.
+
+Each module is imported in a fresh interpreter with ``-X importtime``, so
+nothing is shared between runs. The report gives the median wall time, the
+slowest third-party packages pulled in, and any heavy package (TensorFlow,
+Keras, NLTK, matplotlib, ...) that was loaded even though the module should
+only load it on first use. With ``--check`` the script exits non-zero when
+a module goes over its budget or imports a heavy package eagerly, so it can
+guard cold-start time in CI.
+
+    python benchmarks/import_time.py --check -o import_time.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Module -> seconds allowed for a cold import.
+BUDGETS: Dict[str, float] = {
+    'stigmapyze.scraping.main': 1.0,
+    'stigmapyze.scraping.pushshift': 1.0,
+    'stigmapyze.nlp.preprocessing': 2.0,
+    'stigmapyze.nlp.serve': 2.0,
+}
+HEAVY: List[str] = [
+    'tensorflow', 'keras', 'torch', 'nltk', 'matplotlib', 'seaborn', 'bs4',
+    'praw', 'sklearn', 'pandas',
+]
+# Heavy packages each module genuinely needs at import time.
+ALLOWED: Dict[str, List[str]] = {
+    'stigmapyze.nlp.preprocessing': ['pandas'],
+    'stigmapyze.nlp.serve': ['pandas'],
+}
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'modules': sorted(sys.modules)}}))
+'''
+
+
+def parse_importtime(stderr: str) -> Dict[str, float]:
+    """Cumulative seconds per top-level package from ``-X importtime``."""
+    out: Dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        # A package's own line covers everything imported beneath it.
+        if '.' not in name:
+            out[name] = max(out.get(name, 0.), int(cumulative) / 1e6)
+    return out
+
+
+def measure(module: str, repeat: int) -> dict:
+    times, packages, loaded = [], {}, set()
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE.format(module=module)],
+            cwd=ROOT,
+            capture_output=True,
+            text=True
+        )
+        if proc.returncode != 0:
+            return {'module': module, 'error': proc.stderr.strip().splitlines()[-1]}
+        probe = json.loads(proc.stdout.strip().splitlines()[-1])
+        times.append(probe['seconds'])
+        loaded = {m.split('.')[0] for m in probe['modules']}
+        packages = parse_importtime(proc.stderr)
+
+    slowest = sorted(
+        ((p, s) for p, s in packages.items() if p != 'stigmapyze'),
+        key=lambda t: t[1],
+        reverse=True
+    )[:8]
+    return {
+        'module': module,
+        'median_s': statistics.median(times),
+        'min_s': min(times),
+        'budget_s': BUDGETS.get(module),
+        'slowest_packages': dict(slowest),
+        'eager_heavy': sorted(
+            h for h in HEAVY if h in loaded and h not in ALLOWED.get(module, [])
+        ),
+    }
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=list(BUDGETS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--check', action='store_true',
+                        help='exit 1 on a blown budget or an eager heavy import')
+    parser.add_argument('-o', '--output', help='write results as JSON here')
+    args = parser.parse_args(argv)
+
+    results = []
+    failed = False
+    for module in args.modules:
+        res = measure(module, args.repeat)
+        print(json.dumps(res), file=sys.stderr)
+        results.append(res)
+        budget = res.get('budget_s')
+        if 'error' in res or res['eager_heavy'] or (budget and res['median_s'] > budget):
+            failed = True
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    else:
+        print(json.dumps(results, indent=4))
+    if args.check and failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+"""Throughput, peak memory and scaling of the NLP preprocessing hot paths.
+
+Times `standardize_formatting`, `remove_words`, `stem_words` (both modes),
+`tagging.TaggingEngine.lemmatize` on every core, `tokenization`,
+`vis.get_ngrams` and `neural.load_glove_index` on synthetic Reddit-like
+corpora: log-normal post lengths, a Zipfian vocabulary mixed with real
+English stopwords, punctuation, [tags], emoji and URLs. Each
+(function, size) pair runs in a fresh process so peak RSS is its own, and
+peak allocation is traced in one extra untimed run. Once a function times
+out, larger sizes of it are skipped. Results, including a log-log scaling
+exponent per function (1.0 = linear), are written as JSON stamped with the
+git commit, and ``--baseline`` prints speedups against an earlier run.
+
+    python benchmarks/preprocessing.py --sizes 1000 10000 -o before.json
+    python benchmarks/preprocessing.py --sizes 1000 10000 --baseline before.json
+"""
+import argparse
+from datetime import datetime
+import json
+import multiprocessing as mp
+import os
+import platform
+import queue as queues
+import resource
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+import tracemalloc
+from typing import Callable, Dict, List
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STOPWORDS = (
+    'i me my myself we our you your he him his she her it its they them what '
+    'which who this that am is are was were be been being have has had do '
+    'does did a an the and but if or because as until while of at by for with '
+    'about against between into through during before after to from up down '
+    'in out on off over under again then once here there when where why how '
+    'all any both each few more most other some such no nor not only own same '
+    'so than too very can will just don should now'
+).split()
+EMOJI = ['\U0001F600', '\U0001F622', '\U0001F494', '❤', '\U0001F64F', '\U0001F643']
+PUNCT = list('.,!?;:"()-\'') + ['...', '!!', '?!']
+_CLEANUP: List[Callable[[], None]] = []
+
+
+def synthetic_corpus(n_docs: int, seed: int = 0, vocab: int = 50000) -> List[str]:
+    """Reddit-like posts: mostly short, with a long tail of multi-paragraph ones."""
+    rng = np.random.default_rng(seed)
+    words = np.array(
+        STOPWORDS + [
+            ''.join(rng.choice(list('abcdefghijklmnopqrstuvwxyz'), rng.integers(2, 11)))
+            for _ in range(vocab)
+        ]
+    )
+    # Stopwords take the most frequent Zipf ranks, as in real text.
+    ranks = np.arange(1, len(words) + 1)
+    p = 1 / ranks**1.1
+    p /= p.sum()
+
+    lengths = np.clip(rng.lognormal(3.7, 1.0, n_docs).astype(int), 1, 3000)
+    tokens = rng.choice(words, size=int(lengths.sum()), p=p)
+    docs, start = [], 0
+    for length in lengths:
+        doc = list(tokens[start:start + length])
+        start += length
+        for _ in range(rng.poisson(length / 12)):
+            i = rng.integers(len(doc))
+            doc[i] += PUNCT[rng.integers(len(PUNCT))]
+        if rng.random() < .05:
+            doc.insert(rng.integers(len(doc) + 1), ''.join(rng.choice(EMOJI, rng.integers(1, 4))))
+        if rng.random() < .08:
+            doc.insert(rng.integers(len(doc) + 1), f'https://www.reddit.com/r/{doc[0]}/comments/{rng.integers(1e9):x}')
+        if rng.random() < .03:
+            doc.insert(0, '[removed]')
+        if rng.random() < .1:
+            doc.insert(rng.integers(len(doc) + 1), f'{doc[-1]}{rng.integers(100)}x')
+        text = ' '.join(doc)
+        if length > 80:
+            text = text.replace('. ', '.\n\n', 2)
+        docs.append(text.capitalize())
+    return docs
+
+
+def _glove_file(n_rows: int, dim: int = 300, seed: int = 0) -> str:
+    rng = np.random.default_rng(seed)
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    _CLEANUP.append(lambda: os.unlink(path))
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for i in range(n_rows):
+            f.write(f'w{i} ' + ' '.join(f'{v:.5f}' for v in rng.standard_normal(dim)) + '\n')
+    return path
+
+
+def case_standardize_formatting(docs: List[str]) -> Callable[[], object]:
+    import pandas as pd
+    from stigmapyze.nlp.preprocessing import standardize_formatting
+    return lambda: standardize_formatting(pd.Series(docs))
+
+
+def case_remove_words(docs: List[str]) -> Callable[[], object]:
+    import pandas as pd
+    from stigmapyze.nlp.preprocessing import remove_words, standardize_formatting
+    series = standardize_formatting(pd.Series(docs))
+    return lambda: remove_words(series.copy(), stopwords=True, freqwords=10, rarewords=10)
+
+
+def case_stem(docs: List[str]) -> Callable[[], object]:
+    from stigmapyze.nlp.preprocessing import stem_words
+    return lambda: [stem_words(t, 'stem') for t in docs]
+
+
+def case_lemmatize(docs: List[str]) -> Callable[[], object]:
+    from stigmapyze.nlp.preprocessing import stem_words
+    return lambda: [stem_words(t, 'lemmatize') for t in docs]
+
+
+def case_engine_lemmatize(docs: List[str]) -> Callable[[], object]:
+    from stigmapyze.nlp.tagging import TaggingEngine
+    engine = TaggingEngine(n_jobs=os.cpu_count() or 1, cache_size=0)
+    _CLEANUP.append(engine.close)
+    return lambda: engine.lemmatize(docs)
+
+
+def case_tokenization(docs: List[str]) -> Callable[[], object]:
+    from stigmapyze.nlp.preprocessing import tokenization
+    return lambda: [tokenization(t) for t in docs]
+
+
+def case_get_ngrams(docs: List[str]) -> Callable[[], object]:
+    from stigmapyze.nlp.vis import get_ngrams
+    return lambda: get_ngrams(docs, 2, 20)
+
+
+def case_load_glove_index(docs: List[str]) -> Callable[[], object]:
+    # Sized by GloVe rows rather than documents: one row per document.
+    from stigmapyze.nlp.neural import load_glove_index
+    path = _glove_file(len(docs))
+    word_index = {f'w{i}': i + 1 for i in range(0, len(docs), 2)}
+    return lambda: load_glove_index(word_index, path)
+
+
+CASES: Dict[str, Callable[[List[str]], Callable[[], object]]] = {
+    'standardize_formatting': case_standardize_formatting,
+    'remove_words': case_remove_words,
+    'stem_words[stem]': case_stem,
+    'stem_words[lemmatize]': case_lemmatize,
+    'TaggingEngine.lemmatize': case_engine_lemmatize,
+    'tokenization': case_tokenization,
+    'get_ngrams': case_get_ngrams,
+    'load_glove_index': case_load_glove_index,
+}
+
+
+def run(case: str, n_docs: int, repeat: int, seed: int, queue: mp.Queue) -> None:
+    result = {'case': case, 'n_docs': n_docs}
+    try:
+        docs = synthetic_corpus(n_docs, seed)
+        fn = CASES[case](docs)
+        result['n_tokens'] = sum(len(d.split()) for d in docs)
+        fn()  # warm-up: lazy imports, NLTK corpora, regex caches
+        times = []
+        for _ in range(repeat):
+            start = perf_counter()
+            fn()
+            times.append(perf_counter() - start)
+        best = min(times)
+        # A separate traced run: tracemalloc slows the code it watches.
+        tracemalloc.start()
+        fn()
+        _, peak_alloc = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result.update(
+            seconds=best,
+            docs_per_sec=n_docs / best,
+            tokens_per_sec=result['n_tokens'] / best,
+            peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            peak_alloc_mb=peak_alloc / 2**20,
+        )
+    except Exception as e:  # e.g. NLTK data not downloaded
+        result['error'] = f'{type(e).__name__}: {" ".join(str(e).split())[:200]}'
+    finally:
+        for cleanup in _CLEANUP:
+            cleanup()
+    queue.put(result)
+
+
+def scaling(results: List[dict]) -> Dict[str, float]:
+    """Slope of log(seconds) on log(n_docs) per case."""
+    out = {}
+    for case in CASES:
+        pts = [(r['n_docs'], r['seconds']) for r in results
+               if r['case'] == case and 'seconds' in r and r['seconds'] > 0]
+        if len(pts) >= 2:
+            x, y = np.log([p[0] for p in pts]), np.log([p[1] for p in pts])
+            out[case] = float(np.polyfit(x, y, 1)[0])
+    return out
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+            text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results: List[dict], baseline_path: str) -> None:
+    with open(baseline_path, 'r') as f:
+        baseline = {(r['case'], r['n_docs']): r for r in json.load(f)['results']}
+    print(f'{"case":<24}{"n_docs":>10}{"before s":>12}{"after s":>12}{"speedup":>10}')
+    for r in results:
+        old = baseline.get((r['case'], r['n_docs']))
+        if old is None or 'seconds' not in old or 'seconds' not in r:
+            continue
+        print(f'{r["case"]:<24}{r["n_docs"]:>10}{old["seconds"]:>12.4f}'
+              f'{r["seconds"]:>12.4f}{old["seconds"] / r["seconds"]:>9.2f}x')
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='seconds per run; larger sizes of a timed-out case are skipped')
+    parser.add_argument('--baseline', help='earlier JSON output to compare against')
+    parser.add_argument('-o', '--output', help='write results as JSON here')
+    args = parser.parse_args(argv)
+
+    ctx = mp.get_context('spawn')
+    results = []
+    for case in args.cases:
+        for n_docs in sorted(args.sizes):
+            queue = ctx.Queue()
+            proc = ctx.Process(target=run, args=(case, n_docs, args.repeat, args.seed, queue))
+            proc.start()
+            try:
+                res = queue.get(timeout=args.timeout)
+            except queues.Empty:
+                proc.terminate()
+                res = {'case': case, 'n_docs': n_docs, 'error': f'timeout after {args.timeout}s'}
+            proc.join()
+            print(json.dumps(res), file=sys.stderr)
+            results.append(res)
+            if 'error' in res:
+                break
+
+    report = {
+        'meta': {
+            'commit': _commit(),
+            'date': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'results': results,
+        'scaling': scaling(results),
+    }
+    if args.baseline:
+        compare(results, args.baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    elif not args.baseline:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
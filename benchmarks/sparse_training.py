@@ -0,0 +1,114 @@
+"""Step time and peak RSS of dense vs sparse Keras training on n-gram inputs.
+
+Compares the analysis.ipynb path (CSR matrix handed to `fit` with a dense
+`Input`) with `stigmapyze.nlp.neural.fit_sparse` on synthetic count matrices
+the width of 1-3-gram vocabularies. Every run happens in a fresh process so
+peak RSS is not shared between them.
+
+    python benchmarks/sparse_training.py --vocab 50000 200000 1000000 -o sparse.json
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue as queues
+import resource
+import sys
+from time import perf_counter
+from typing import List
+
+import numpy as np
+from scipy.sparse import random as sparse_random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def synthetic(n_docs: int, n_features: int, nnz_per_doc: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    X = sparse_random(
+        n_docs,
+        n_features,
+        density=nnz_per_doc / n_features,
+        format='csr',
+        dtype=np.float32,
+        random_state=seed,
+        data_rvs=lambda n: rng.integers(1, 4, n).astype(np.float32)
+    )
+    X.sort_indices()
+    y = (rng.random((n_docs, 10)) < .2).astype(np.float32)
+    return X, y
+
+
+def run(path: str, n_features: int, n_docs: int, nnz: int, batch_size: int,
+        epochs: int, queue: mp.Queue) -> None:
+    from stigmapyze.nlp.neural import counts_sequential, fit_sparse
+
+    X, y = synthetic(n_docs, n_features, nnz)
+    try:
+        model = counts_sequential(n_features, sparse=path == 'sparse')
+        if path == 'sparse':
+            fit = lambda e: fit_sparse(model, X, y, batch_size=batch_size, epochs=e, verbose=0)
+        else:
+            fit = lambda e: model.fit(X, y, batch_size=batch_size, epochs=e, verbose=0)
+
+        fit(1)  # warm-up: graph tracing
+        start = perf_counter()
+        fit(epochs)
+        elapsed = perf_counter() - start
+        steps = epochs * -(-n_docs // batch_size)
+        result = {'step_ms': 1000 * elapsed / steps}
+    except Exception as e:  # e.g. OOM on the dense path at large vocabularies
+        result = {'error': f'{type(e).__name__}: {e}'}
+
+    result.update(
+        path=path,
+        n_features=n_features,
+        n_docs=n_docs,
+        nnz_per_doc=nnz,
+        peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    )
+    queue.put(result)
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vocab', type=int, nargs='+', default=[50000, 200000, 1000000])
+    parser.add_argument('--docs', type=int, default=4000)
+    parser.add_argument('--nnz', type=int, default=300, help='nonzeros per document')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('-o', '--output', help='write results as JSON here')
+    args = parser.parse_args(argv)
+
+    ctx = mp.get_context('spawn')
+    results = []
+    for n_features in args.vocab:
+        for path in ('dense', 'sparse'):
+            queue = ctx.Queue()
+            proc = ctx.Process(
+                target=run,
+                args=(path, n_features, args.docs, args.nnz, args.batch_size,
+                      args.epochs, queue)
+            )
+            proc.start()
+            proc.join()
+            try:
+                res = queue.get(timeout=1)
+            except queues.Empty:
+                res = {
+                    'path': path,
+                    'n_features': n_features,
+                    'error': f'exit code {proc.exitcode}'
+                }
+            print(json.dumps(res), file=sys.stderr)
+            results.append(res)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    else:
+        print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,7 @@ class RedditContent:
         self.created_utc = resp.get('created_utc')
         self.id = resp.get('id')
         self.score = resp.get('score')
+        self.subreddit = resp.get('subreddit')
 
     def __eq__(self, o: object) -> bool:
         return self.created_utc == o.created_utc
@@ -26,7 +27,7 @@ class RedditContent:
 
     @staticmethod
     def csv_fields() -> List[str]:
-        return ['created_utc', 'id', 'score', 'author']
+        return ['created_utc', 'id', 'score', 'author', 'subreddit']
 
 
 class Comment(RedditContent):
@@ -61,6 +62,7 @@ class Comment(RedditContent):
             'parent_id',
             'link_id',
             'body',
+            'subreddit',
         ]
 
     @classmethod
@@ -124,6 +126,7 @@ class Submission(RedditContent):
             'full_link',
             'comments',
             'selftext',
+            'subreddit',
         ]
 
     @classmethod
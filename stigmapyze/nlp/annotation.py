@@ -0,0 +1,189 @@
+from csv import DictReader, DictWriter
+import heapq
+from typing import Dict, Final, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+import numpy as np
+
+from .hashing import HashingFeaturizer
+from ..scraping.util import STIGMA_HEADER, stigma_row
+
+SCORE_BATCH: Final[int] = 512
+# Hashed unigrams are plenty to tell near-identical posts apart.
+SKETCH_FEATURES: Final[int] = 2**12
+EPS: Final[float] = 1e-7
+
+
+def read_unlabeled(
+    stigma_file: TextIO,
+    submission_file: Optional[TextIO] = None,
+    comment_file: Optional[TextIO] = None
+) -> Iterator[Tuple[str, str]]:
+    """Yields (ID, text) for every row of a stigma CSV not yet labeled.
+
+    IDs are the stigma CSV's 'Submission <id>'/'Comment <id>' strings. Text
+    is the submission title and selftext, or the comment body, looked up in
+    the scraped CSVs written alongside the stigma CSV by `scrape_until`.
+    """
+    texts: Dict[str, str] = {}
+    if submission_file is not None:
+        for row in DictReader(submission_file):
+            texts[f'Submission {row["id"]}'] = f'{row["title"]} {row["selftext"]}'
+    if comment_file is not None:
+        for row in DictReader(comment_file):
+            texts[f'Comment {row["id"]}'] = row['body']
+
+    for row in DictReader(stigma_file):
+        if is_labeled(row):
+            continue
+        if row['ID'] in texts:
+            yield row['ID'], texts[row['ID']]
+
+
+def is_labeled(row: dict) -> bool:
+    return any(str(row.get(col) or '').strip() for col in STIGMA_HEADER[1:])
+
+
+def uncertainty(probs: np.ndarray) -> np.ndarray:
+    """Mean binary entropy across labels (1 = every label at p=.5)."""
+    p = np.clip(np.asarray(probs, dtype=np.float64), EPS, 1 - EPS)
+    return (-(p * np.log2(p) + (1 - p) * np.log2(1 - p))).mean(axis=1)
+
+
+class AnnotationQueue:
+    """Priority index of unlabeled posts, most useful to annotate first.
+
+    Items are scored with the current classifier in batches and kept in a
+    heap by uncertainty. Rescoring or labeling an item only invalidates its
+    old heap entry, so updates as labels arrive or the model is retrained
+    cost O(log n) per item instead of a rebuild. Batches are drawn greedily
+    from the top of the heap, discounting items similar to ones already in
+    the batch so annotators don't see the same crosspost five times.
+
+    Attributes:
+        scorer: Anything with `predict(texts) -> np.ndarray` of per-label
+            probabilities, e.g. `serve.Scorer`.
+        diversity (float): Weight of the similarity penalty, 0 to disable.
+        pool_factor (int): Candidates considered per batch slot.
+    """
+
+    def __init__(
+        self,
+        scorer,
+        diversity: float = .5,
+        pool_factor: int = 5,
+        batch_size: int = SCORE_BATCH
+    ) -> None:
+        self.scorer = scorer
+        self.diversity = diversity
+        self.pool_factor = pool_factor
+        self.batch_size = batch_size
+        self.labeled: set = set()
+        self._heap: List[Tuple[float, int, str]] = []
+        self._scores: Dict[str, float] = {}
+        self._texts: Dict[str, str] = {}
+        self._version: Dict[str, int] = {}
+        self._sketch = HashingFeaturizer(
+            n_features=SKETCH_FEATURES, ngram_range=(1, 1)
+        )
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def add(self, items: Iterable[Tuple[str, str]]) -> None:
+        """Scores (ID, text) pairs in batches and indexes them."""
+        batch: List[Tuple[str, str]] = []
+        for item in items:
+            if item[0] in self.labeled:
+                continue
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                self._score(batch)
+                batch = []
+        if batch:
+            self._score(batch)
+
+    def rescore(self) -> None:
+        """Rescores every queued item, e.g. after the model was retrained."""
+        self.add(list(self._texts.items()))
+
+    def mark_labeled(self, ids: Iterable[str]) -> None:
+        for id in ids:
+            self.labeled.add(id)
+            self._scores.pop(id, None)
+            self._texts.pop(id, None)
+            self._version[id] = self._version.get(id, 0) + 1
+
+    def ingest_labels(self, stigma_file: TextIO) -> int:
+        """Drops every item labeled in a (partly) tagged stigma CSV."""
+        done = [row['ID'] for row in DictReader(stigma_file) if is_labeled(row)]
+        self.mark_labeled(done)
+        return len(done)
+
+    def _score(self, batch: List[Tuple[str, str]]) -> None:
+        ids = [id for id, _ in batch]
+        texts = [t for _, t in batch]
+        scores = uncertainty(self.scorer.predict(texts))
+        for id, text, score in zip(ids, texts, scores):
+            version = self._version.get(id, 0) + 1
+            self._version[id] = version
+            self._scores[id] = float(score)
+            self._texts[id] = text
+            heapq.heappush(self._heap, (-float(score), version, id))
+
+    def _pop(self) -> Optional[str]:
+        while self._heap:
+            _, version, id = heapq.heappop(self._heap)
+            if self._version.get(id) == version and id in self._scores:
+                return id
+        return None
+
+    def next_batch(self, n: int) -> List[Tuple[str, float]]:
+        """Takes the `n` items to annotate next out of the queue.
+
+        Returns:
+            List[Tuple[str, float]]: (ID, uncertainty) in selection order.
+        """
+        pool = []
+        while len(pool) < n * self.pool_factor:
+            id = self._pop()
+            if id is None:
+                break
+            pool.append(id)
+        if not pool:
+            return []
+
+        sims = np.zeros(len(pool))
+        if self.diversity:
+            S = self._sketch.transform([self._texts[id] for id in pool])
+            norms = np.sqrt(np.asarray(S.multiply(S).sum(axis=1))).ravel()
+            norms[norms == 0] = 1
+            S = S.multiply(1 / norms[:, None]).tocsr()
+
+        base = np.array([self._scores[id] for id in pool])
+        chosen: List[int] = []
+        available = np.ones(len(pool), dtype=bool)
+        for _ in range(min(n, len(pool))):
+            gain = np.where(available, base - self.diversity * sims, -np.inf)
+            i = int(gain.argmax())
+            chosen.append(i)
+            available[i] = False
+            if self.diversity:
+                sims = np.maximum(sims, (S @ S[i].T).toarray().ravel())
+
+        for i in np.flatnonzero(available):
+            id = pool[i]
+            heapq.heappush(self._heap, (-base[i], self._version[id], id))
+
+        batch = [(pool[i], float(base[i])) for i in chosen]
+        for id, _ in batch:
+            self._scores.pop(id)
+            self._texts.pop(id)
+        return batch
+
+    def write_batch(self, fp: TextIO, batch: Sequence[Tuple[str, float]]) -> None:
+        """Writes blank rows for `batch` in the stigma CSV format."""
+        writer = DictWriter(fp, fieldnames=STIGMA_HEADER)
+        writer.writeheader()
+        for id, _ in batch:
+            kind, post_id = id.split(' ', 1)
+            writer.writerow(stigma_row(post_id, kind))
@@ -0,0 +1,347 @@
+from datetime import datetime
+from hashlib import blake2b
+import json
+import os
+from typing import Any, Dict, Final, List, Optional, Sequence
+
+import numpy as np
+
+FORMAT_VERSION: Final[int] = 1
+MANIFEST: Final[str] = 'manifest.json'
+MODEL_DIR: Final[str] = 'model'
+
+# CountVectorizer/TfidfVectorizer parameters that decide how text is analyzed
+# and weighted. Callables (custom preprocessor/tokenizer/analyzer) can't be
+# bundled and are rejected on export.
+VECTORIZER_PARAMS: Final[List[str]] = [
+    'analyzer',
+    'binary',
+    'lowercase',
+    'ngram_range',
+    'stop_words',
+    'strip_accents',
+    'token_pattern',
+]
+TFIDF_PARAMS: Final[List[str]] = ['norm', 'use_idf', 'smooth_idf', 'sublinear_tf']
+TOKENIZER_PARAMS: Final[List[str]] = ['num_words', 'filters', 'lower', 'split', 'oov_token']
+
+
+def term_hash(term: str) -> int:
+    return int.from_bytes(
+        blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little'
+    )
+
+
+class Vocabulary:
+    """Read-only term -> column table stored as flat arrays.
+
+    Terms are kept sorted by a 64-bit hash next to their columns, with the
+    UTF-8 bytes of every term in one blob to rule out hash collisions. All
+    four arrays can be memory-mapped, so a vocabulary of millions of n-grams
+    costs nothing to open and is never turned back into a dict.
+
+    Attributes:
+        hashes (np.ndarray): Sorted uint64 term hashes.
+        columns (np.ndarray): Column of the term at the same position.
+        offsets (np.ndarray): Start of each term in `blob`, plus the end.
+        blob (np.ndarray): Concatenated UTF-8 term bytes (uint8).
+    """
+    FILES: Final[List[str]] = ['hashes', 'columns', 'offsets', 'blob']
+
+    def __init__(
+        self,
+        hashes: np.ndarray,
+        columns: np.ndarray,
+        offsets: np.ndarray,
+        blob: np.ndarray
+    ) -> None:
+        self.hashes = hashes
+        self.columns = columns
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    @classmethod
+    def build(cls, mapping: Dict[str, int]) -> 'Vocabulary':
+        terms = list(mapping)
+        hashes = np.fromiter(
+            (term_hash(t) for t in terms), dtype=np.uint64, count=len(terms)
+        )
+        order = np.argsort(hashes, kind='stable')
+        encoded = [terms[i].encode('utf-8') for i in order]
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(
+            hashes[order],
+            np.fromiter((mapping[terms[i]] for i in order),
+                        dtype=np.int64,
+                        count=len(terms)),
+            offsets,
+            np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        )
+
+    def save(self, path: str, prefix: str) -> None:
+        for name in self.FILES:
+            np.save(os.path.join(path, f'{prefix}_{name}.npy'), getattr(self, name))
+
+    @classmethod
+    def load(cls, path: str, prefix: str, mmap: bool = True) -> 'Vocabulary':
+        return cls(
+            *(
+                np.load(
+                    os.path.join(path, f'{prefix}_{name}.npy'),
+                    mmap_mode='r' if mmap else None
+                ) for name in cls.FILES
+            )
+        )
+
+    def term(self, pos: int) -> str:
+        return bytes(self.blob[self.offsets[pos]:self.offsets[pos + 1]]
+                    ).decode('utf-8')
+
+    def lookup(self, terms: Sequence[str]) -> np.ndarray:
+        """Columns of `terms`, or -1 for terms not in the vocabulary."""
+        hashes = np.fromiter(
+            (term_hash(t) for t in terms), dtype=np.uint64, count=len(terms)
+        )
+        found = np.searchsorted(self.hashes, hashes)
+        out = np.full(len(terms), -1, dtype=np.int64)
+        n = len(self.hashes)
+        for i, (t, pos) in enumerate(zip(terms, found)):
+            while pos < n and self.hashes[pos] == hashes[i]:
+                if self.term(pos) == t:
+                    out[i] = self.columns[pos]
+                    break
+                pos += 1
+        return out
+
+
+class Bundle:
+    """A versioned, self-contained preprocessing + model package.
+
+    Only the manifest is read on `load`; the vocabulary is memory-mapped and
+    the Keras model (and Keras itself) is loaded on first use, so opening a
+    bundle to start a scoring process is close to free.
+
+    Attributes:
+        path (str): Bundle directory.
+        manifest (dict): Format version, featurizer kind and options,
+            preprocessing options, labels and user metadata.
+    """
+
+    def __init__(self, path: str, manifest: dict) -> None:
+        self.path = path
+        self.manifest = manifest
+        self._vocab: Optional[Vocabulary] = None
+        self._idf: Optional[np.ndarray] = None
+        self._model = None
+        self._analyzer = None
+
+    @classmethod
+    def load(cls, path: str) -> 'Bundle':
+        with open(os.path.join(path, MANIFEST), 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('format', 0) > FORMAT_VERSION:
+            raise ValueError(
+                f'{path} is bundle format {manifest["format"]}; '
+                f'this version of stigmapyze reads up to {FORMAT_VERSION}.'
+            )
+        return cls(path, manifest)
+
+    @property
+    def kind(self) -> str:
+        return self.manifest['featurizer']
+
+    @property
+    def labels(self) -> List[str]:
+        return self.manifest['labels']
+
+    @property
+    def preprocess(self) -> dict:
+        return self.manifest.get('preprocess', {})
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.manifest.get('version')
+
+    @property
+    def vocabulary(self) -> Vocabulary:
+        if self._vocab is None:
+            self._vocab = Vocabulary.load(self.path, 'vocab')
+        return self._vocab
+
+    @property
+    def idf(self) -> np.ndarray:
+        if self._idf is None:
+            self._idf = np.load(os.path.join(self.path, 'idf.npy'), mmap_mode='r')
+        return self._idf
+
+    @property
+    def model(self):
+        if self._model is None:
+            from keras.models import load_model
+            self._model = load_model(os.path.join(self.path, MODEL_DIR))
+        return self._model
+
+    def featurize(self, texts: List[str]):
+        """Turns preprocessed texts into model input, as at training time."""
+        if self.kind == 'tokenizer':
+            return self._sequences(texts)
+        return self._vectorize(texts)
+
+    def decode(self, probs: np.ndarray, threshold: float = .5) -> List[List[str]]:
+        """Inverse of the MultiLabelBinarizer for thresholded probabilities."""
+        labels = np.asarray(self.labels)
+        return [list(labels[row >= threshold]) for row in np.asarray(probs)]
+
+    def _vectorize(self, texts: List[str]):
+        from scipy.sparse import csr_matrix
+        opts = self.manifest['options']
+        if self._analyzer is None:
+            from sklearn.feature_extraction.text import CountVectorizer
+            params = {k: opts[k] for k in VECTORIZER_PARAMS}
+            params['ngram_range'] = tuple(params['ngram_range'])
+            self._analyzer = CountVectorizer(**params).build_analyzer()
+
+        rows: List[int] = []
+        grams: Dict[str, int] = {}
+        cols: List[int] = []
+        for i, doc in enumerate(texts):
+            for g in self._analyzer(doc):
+                rows.append(i)
+                cols.append(grams.setdefault(g, len(grams)))
+        columns = self.vocabulary.lookup(list(grams))[np.asarray(cols, dtype=np.int64)]
+        keep = columns >= 0
+        X = csr_matrix(
+            (
+                np.ones(int(keep.sum()), dtype=np.float32),
+                (np.asarray(rows, dtype=np.int64)[keep], columns[keep])
+            ),
+            shape=(len(texts), self.manifest['n_features'])
+        )
+        X.sum_duplicates()
+        if opts['binary']:
+            X.data[:] = 1
+        if self.kind == 'tfidf':
+            if opts['sublinear_tf']:
+                np.log(X.data, out=X.data)
+                X.data += 1
+            if opts['use_idf']:
+                X.data *= np.asarray(self.idf, dtype=np.float32)[X.indices]
+            if opts['norm']:
+                from sklearn.preprocessing import normalize
+                X = normalize(X, norm=opts['norm'], copy=False)
+        X.sort_indices()
+        return X
+
+    def _sequences(self, texts: List[str]) -> np.ndarray:
+        opts = self.manifest['options']
+        num_words, oov = opts['num_words'], opts['oov_token']
+        oov_index = self.vocabulary.lookup([oov])[0] if oov is not None else -1
+        table = str.maketrans({c: opts['split'] for c in opts['filters']})
+        maxlen = self.manifest['maxlen']
+
+        out = np.zeros((len(texts), maxlen), dtype=np.int32)
+        for i, doc in enumerate(texts):
+            if opts['lower']:
+                doc = doc.lower()
+            words = [w for w in doc.translate(table).split(opts['split']) if w]
+            idx = self.vocabulary.lookup(words)
+            if num_words:
+                idx[idx >= num_words] = oov_index
+            idx = idx[idx >= 0] if oov_index < 0 else np.where(idx < 0, oov_index, idx)
+            idx = idx[-maxlen:] if self.manifest['truncating'] == 'pre' else idx[:maxlen]
+            if self.manifest['padding'] == 'post':
+                out[i, :len(idx)] = idx
+            else:
+                out[i, maxlen - len(idx):] = idx
+        return out
+
+
+def export_bundle(
+    path: str,
+    model,
+    featurizer,
+    labels: Any,
+    preprocess: Optional[dict] = None,
+    maxlen: Optional[int] = None,
+    padding: str = 'post',
+    truncating: str = 'pre',
+    version: Optional[str] = None
+) -> Bundle:
+    """Writes a trained model and its fitted preprocessing to `path`.
+
+    Args:
+        path (str): Directory to create (or overwrite files in).
+        model: A Keras model; saved with `model.save`.
+        featurizer: A fitted CountVectorizer, TfidfVectorizer, or Keras
+            Tokenizer.
+        labels: The fitted MultiLabelBinarizer, or label names in model
+            output order.
+        preprocess (dict, optional): Options for
+            `preprocessing.preprocess_texts`, as used at training time. With
+            `freqwords`/`rarewords` they must come from `fit_word_lists`, so
+            the training-time word lists ship with the bundle.
+        maxlen (int, optional): Padded sequence length; required for a
+            Tokenizer.
+        padding, truncating (str, optional): `pad_sequences` options used at
+            training time. By default 'post' and 'pre', as in analysis.ipynb.
+        version (str, optional): Free-form model version recorded in the
+            manifest.
+
+    Returns:
+        Bundle: The written bundle, opened for use.
+    """
+    from .preprocessing import check_options
+
+    check_options(preprocess or {})
+    os.makedirs(path, exist_ok=True)
+    manifest: Dict[str, Any] = {
+        'format': FORMAT_VERSION,
+        'version': version,
+        'created': datetime.utcnow().isoformat(),
+        'labels': [str(l) for l in getattr(labels, 'classes_', labels)],
+        'preprocess': preprocess or {},
+    }
+
+    if hasattr(featurizer, 'word_index'):
+        if featurizer.char_level:
+            raise ValueError('Character-level tokenizers are not supported.')
+        if maxlen is None:
+            raise ValueError('maxlen is required to bundle a Tokenizer.')
+        manifest.update(
+            featurizer='tokenizer',
+            options={k: getattr(featurizer, k) for k in TOKENIZER_PARAMS},
+            maxlen=maxlen,
+            padding=padding,
+            truncating=truncating,
+        )
+        vocab = featurizer.word_index
+    else:
+        params = featurizer.get_params()
+        if not isinstance(params['analyzer'], str) or any(
+            params[k] is not None for k in ('preprocessor', 'tokenizer')
+        ):
+            raise ValueError('Vectorizers with custom callables cannot be bundled.')
+        if params['stop_words'] is not None and not isinstance(params['stop_words'], str):
+            params['stop_words'] = sorted(params['stop_words'])
+        is_tfidf = 'use_idf' in params
+        keys = VECTORIZER_PARAMS + (TFIDF_PARAMS if is_tfidf else [])
+        vocab = featurizer.vocabulary_
+        manifest.update(
+            featurizer='tfidf' if is_tfidf else 'count',
+            options={k: params[k] for k in keys},
+            n_features=len(vocab),
+        )
+        if is_tfidf and featurizer.use_idf:
+            np.save(os.path.join(path, 'idf.npy'),
+                    np.asarray(featurizer.idf_, dtype=np.float32))
+
+    Vocabulary.build(vocab).save(path, 'vocab')
+    model.save(os.path.join(path, MODEL_DIR))
+    with open(os.path.join(path, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+    return Bundle.load(path)
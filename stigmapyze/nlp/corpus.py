@@ -0,0 +1,181 @@
+from csv import DictReader
+from typing import Callable, Dict, Final, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .preprocessing import fit_word_lists, preprocess_texts
+from ..scraping.util import STIGMA_HEADER
+
+# MultiLabelBinarizer sorts its classes, so model outputs come in this order.
+LABELS: Final[List[str]] = sorted(STIGMA_HEADER[1:])
+BATCH_SIZE: Final[int] = 1024
+
+Batch = Tuple[List[str], np.ndarray]
+
+
+def read_labels(
+    stigma_file: str,
+    labels: List[str] = LABELS
+) -> Dict[str, np.ndarray]:
+    """Loads a tagged stigma CSV the way analysis.ipynb prepares it.
+
+    -1 and blank cells count as missing, rows with every label missing are
+    dropped, and the remaining missing cells become 0.
+
+    Returns:
+        Dict[str, np.ndarray]: Label vector (in `labels` order) keyed by the
+            'Submission <id>'/'Comment <id>' ID.
+    """
+    out = {}
+    with open(stigma_file, 'r', newline='') as f:
+        for row in DictReader(f):
+            values = [(row.get(l) or '').strip() for l in labels]
+            values = [np.nan if v in ('', '-1', '-1.0') else float(v) for v in values]
+            if all(np.isnan(v) for v in values):
+                continue
+            out[row['ID']] = np.nan_to_num(np.asarray(values, dtype=np.float32))
+    return out
+
+
+class Corpus:
+    """Streams scraped posts in fixed-size batches without loading the corpus.
+
+    Submission selftext and comment bodies are read from the scraped CSVs in
+    chunks of `batch_size` rows, preprocessed a chunk at a time, and (when
+    labels are given) joined with their label vectors, so peak memory is set
+    by the batch size rather than by how many years have been scraped. Only
+    the label table, which is as large as the set of tagged posts, is held in
+    memory.
+
+    Attributes:
+        submissions (str): Path to a submissions CSV, or None.
+        comments (str): Path to a comments CSV, or None.
+        labels (Dict[str, np.ndarray]): Output of `read_labels`, or None.
+        batch_size (int): Texts per yielded batch.
+        preprocess (dict): Options for `preprocessing.preprocess_texts`.
+            `freqwords`/`rarewords` need word lists fitted once over the
+            whole corpus; see `fit_preprocess`.
+        clusters (Dict[str, str]): Output of `dedup.read_clusters`, or None.
+            When given, only one post per near-duplicate cluster is read.
+    """
+
+    def __init__(
+        self,
+        submissions: Optional[str] = None,
+        comments: Optional[str] = None,
+        labels: Optional[Dict[str, np.ndarray]] = None,
+        batch_size: int = BATCH_SIZE,
+        preprocess: Optional[dict] = None,
+        clusters: Optional[Dict[str, str]] = None
+    ) -> None:
+        self.submissions = submissions
+        self.comments = comments
+        self.labels = labels
+        self.batch_size = batch_size
+        self.preprocess = preprocess or {}
+        self.clusters = clusters
+
+    def _rows(self) -> Iterator[Tuple[str, str]]:
+        sources = [
+            (self.submissions, 'Submission', 'selftext'),
+            (self.comments, 'Comment', 'body'),
+        ]
+        for path, kind, column in sources:
+            if path is None:
+                continue
+            for chunk in pd.read_csv(
+                path,
+                usecols=['id', column],
+                dtype=str,
+                keep_default_na=False,
+                chunksize=self.batch_size
+            ):
+                for id, text in zip(chunk['id'], chunk[column]):
+                    key = f'{kind} {id}'
+                    if self.clusters is not None and self.clusters.get(key, key) != key:
+                        continue
+                    yield key, text
+
+    def fit_preprocess(self) -> dict:
+        """Fits `preprocess`'s frequent/rare word lists over the corpus.
+
+        Words are counted over the labeled posts when there are labels,
+        otherwise over every post, in one streaming pass. The fitted options
+        are stored on the corpus and returned, e.g. for `export_bundle`.
+        """
+        texts = (
+            text for id, text in self._rows()
+            if self.labels is None or id in self.labels
+        )
+        self.preprocess = fit_word_lists(texts, self.preprocess, self.batch_size)
+        return self.preprocess
+
+    def __iter__(self) -> Iterator[Batch]:
+        """Yields (texts, label matrix) batches of labeled posts."""
+        if self.labels is None:
+            raise ValueError('Corpus has no labels; iterate texts() instead.')
+        texts: List[str] = []
+        rows: List[np.ndarray] = []
+        for id, text in self._rows():
+            y = self.labels.get(id)
+            if y is None:
+                continue
+            texts.append(text)
+            rows.append(y)
+            if len(texts) == self.batch_size:
+                yield preprocess_texts(texts, self.preprocess), np.stack(rows)
+                texts, rows = [], []
+        if texts:
+            yield preprocess_texts(texts, self.preprocess), np.stack(rows)
+
+    def texts(self) -> Iterator[List[str]]:
+        """Yields batches of every post's text, labeled or not."""
+        batch: List[str] = []
+        for _, text in self._rows():
+            batch.append(text)
+            if len(batch) == self.batch_size:
+                yield preprocess_texts(batch, self.preprocess)
+                batch = []
+        if batch:
+            yield preprocess_texts(batch, self.preprocess)
+
+    def featurized(self, featurize: Callable[[List[str]], object]) -> Iterator[tuple]:
+        """Yields (features, labels) with `featurize` applied per batch."""
+        for texts, y in self:
+            yield featurize(texts), y
+
+    def dataset(self, featurize: Callable[[List[str]], object], n_features: int):
+        """A `tf.data.Dataset` over the featurized corpus for `model.fit`.
+
+        The corpus is re-read from disk every epoch. CSR features (e.g. from
+        `hashing.HashingFeaturizer`) are fed as `tf.SparseTensor`s for the
+        sparse models in `neural`; dense features as-is.
+
+        Args:
+            featurize (Callable): Maps a batch of texts to model input, e.g.
+                `HashingFeaturizer(...).transform` or `Bundle.featurize`.
+            n_features (int): Width of the features.
+        """
+        import tensorflow as tf
+        from scipy.sparse import issparse
+
+        from .neural import csr_to_sparse_tensor
+
+        first_X, first_y = next(self.featurized(featurize))
+        sparse = issparse(first_X)
+        spec = (
+            tf.SparseTensorSpec(shape=(None, n_features), dtype=tf.float32)
+            if sparse else tf.TensorSpec(shape=(None, n_features), dtype=first_X.dtype)
+        )
+
+        def gen():
+            for X, y in self.featurized(featurize):
+                yield (csr_to_sparse_tensor(X) if sparse else X), y
+
+        return tf.data.Dataset.from_generator(
+            gen,
+            output_signature=(
+                spec, tf.TensorSpec(shape=(None, first_y.shape[1]), dtype=tf.float32)
+            )
+        ).prefetch(2)
@@ -0,0 +1,243 @@
+from base64 import b64decode, b64encode
+from csv import DictReader
+import os
+import re
+from typing import Dict, Final, Iterable, Iterator, List, Optional, TextIO, Tuple
+from zlib import crc32
+
+import numpy as np
+
+NUM_PERM: Final[int] = 128
+THRESHOLD: Final[float] = .8
+SHINGLE: Final[int] = 3
+# Mersenne prime above every 32-bit hash, as in standard MinHash.
+PRIME: Final[int] = (1 << 61) - 1
+MAX_HASH: Final[int] = (1 << 32) - 1
+PAT_WORD: re.Pattern = re.compile(r'\w+')
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """(bands, rows) splitting `num_perm` whose S-curve midpoint is closest to `threshold`.
+
+    Two signatures share at least one band with probability
+    1 - (1 - s^rows)^bands for Jaccard similarity s, which rises steeply
+    around (1 / bands)^(1 / rows).
+    """
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda br: abs((1 / br[0])**(1 / br[1]) - threshold))
+
+
+def shingles(text: str, k: int = SHINGLE) -> np.ndarray:
+    """32-bit hashes of the lowercased word k-grams of `text`."""
+    words = PAT_WORD.findall(str(text or '').lower())
+    if len(words) <= k:
+        grams = [' '.join(words)]
+    else:
+        grams = [' '.join(words[i:i + k]) for i in range(len(words) - k + 1)]
+    return np.fromiter((crc32(g.encode('utf-8')) for g in set(grams)), dtype=np.uint64)
+
+
+class NearDuplicateIndex:
+    """Incremental MinHash/LSH clustering of near-duplicate posts.
+
+    Each post is reduced to a MinHash signature of its word shingles, whose
+    agreement rate estimates Jaccard similarity. Signatures are banded into
+    hash tables, so finding candidates costs O(bands) per post regardless of
+    how many posts have been seen. Clustering is leader-based: a post joins
+    the cluster of the first representative it collides with and whose
+    estimated similarity reaches `threshold`; otherwise it becomes the
+    representative of a new cluster. Only representatives are indexed, so
+    memory grows with the number of distinct posts, and a cluster ID never
+    changes once assigned, which lets IDs be written out as posts stream in.
+    While a run goes on, `sync` appends each add to a log beside the saved
+    index, so keeping it on disk costs O(new posts) rather than O(index).
+
+    Attributes:
+        threshold (float): Estimated Jaccard similarity to join a cluster.
+        num_perm (int): MinHash permutations (signature length).
+        shingle (int): Words per shingle.
+        bands (int), rows (int): LSH banding of the signature.
+        sizes (Dict[str, int]): Members per cluster, keyed by cluster ID
+            (the representative's ID).
+    """
+
+    def __init__(
+        self,
+        threshold: float = THRESHOLD,
+        num_perm: int = NUM_PERM,
+        shingle: int = SHINGLE,
+        seed: int = 1
+    ) -> None:
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle = shingle
+        self.seed = seed
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MAX_HASH, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, MAX_HASH, num_perm, dtype=np.uint64)
+        self._tables: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self._ids: List[str] = []
+        self._signatures: List[np.ndarray] = []
+        self.sizes: Dict[str, int] = {}
+        # Posts added so far; numbers the log records.
+        self._added = 0
+        # Adds not yet in the log, and its valid length; kept once the
+        # index is tied to a file (see `save` and `load`).
+        self._unlogged: Optional[List[Tuple[int, str, Optional[np.ndarray]]]] = None
+        self._log_size = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def signature(self, text: str) -> np.ndarray:
+        h = shingles(text, self.shingle)
+        # a, b, h < 2^32, so a * h + b fits in 64 bits without wrapping.
+        perm = (np.outer(self._a, h) + self._b[:, None]) % PRIME & MAX_HASH
+        return perm.min(axis=1).astype(np.uint32)
+
+    def _bands(self, sig: np.ndarray) -> Iterator[bytes]:
+        for i in range(self.bands):
+            yield sig[i * self.rows:(i + 1) * self.rows].tobytes()
+
+    def query(self, text: str, sig: Optional[np.ndarray] = None) -> Optional[str]:
+        """The cluster `text` would join, or None if it is new."""
+        sig = self.signature(text) if sig is None else sig
+        seen = set()
+        for table, key in zip(self._tables, self._bands(sig)):
+            for rep in table.get(key, ()):
+                if rep in seen:
+                    continue
+                seen.add(rep)
+                if (self._signatures[rep] == sig).mean() >= self.threshold:
+                    return self._ids[rep]
+        return None
+
+    def add(self, id: str, text: str) -> str:
+        """Assigns `id` to a cluster and returns the cluster ID."""
+        sig = self.signature(text)
+        cluster = self.query(text, sig)
+        if cluster is None:
+            self._insert(id, sig)
+            return id
+        self._insert(cluster, None)
+        return cluster
+
+    def _insert(self, cluster: str, sig: Optional[np.ndarray]) -> None:
+        """Counts a post in `cluster`, which it founds if `sig` is given."""
+        if sig is not None:
+            self._index_rep(cluster, sig)
+        self.sizes[cluster] = self.sizes.get(cluster, 0) + 1
+        self._added += 1
+        if self._unlogged is not None:
+            self._unlogged.append((self._added, cluster, sig))
+
+    def _index_rep(self, id: str, sig: np.ndarray) -> None:
+        rep = len(self._ids)
+        self._ids.append(id)
+        self._signatures.append(sig)
+        for table, key in zip(self._tables, self._bands(sig)):
+            table.setdefault(key, []).append(rep)
+
+    def add_many(self, items: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+        """Yields (ID, cluster ID) for each (ID, text)."""
+        for id, text in items:
+            yield id, self.add(id, text)
+
+    def save(self, path: str) -> None:
+        """Writes the representatives and cluster sizes to an .npz file.
+
+        The file is replaced in one step, so a crash mid-save leaves the
+        previous index in place. Its log (see `sync`) is then removed; the
+        adds in it are numbered, so a log left by a crash in between is
+        recognized as already saved.
+        """
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(
+                f,
+                params=np.array([self.threshold, self.num_perm, self.shingle, self.seed]),
+                ids=np.array(self._ids, dtype=str),
+                signatures=np.array(self._signatures, dtype=np.uint32).reshape(-1, self.num_perm),
+                size_ids=np.array(list(self.sizes), dtype=str),
+                size_counts=np.array(list(self.sizes.values()), dtype=np.int64),
+                added=np.array(self._added, dtype=np.int64),
+            )
+        os.replace(tmp, path)
+        if os.path.exists(log_path(path)):
+            os.remove(log_path(path))
+        self._unlogged, self._log_size = [], 0
+
+    def sync(self, path: str) -> None:
+        """Brings the index saved at `path` up to date with the adds since.
+
+        They are appended to `log_path(path)`, which `load` replays. The
+        index is saved in full instead if it hasn't been saved there yet,
+        or once the log outgrows the saved file, so loading stays cheap and
+        the total cost of syncing stays linear in the posts added.
+        """
+        if self._unlogged is None or not os.path.exists(path):
+            self.save(path)
+            return
+        if not self._unlogged:
+            return
+        mode = 'r+b' if os.path.exists(log_path(path)) else 'wb'
+        with open(log_path(path), mode) as f:
+            # Drop a record cut short by a crash.
+            f.truncate(self._log_size)
+            f.seek(self._log_size)
+            for n, cluster, sig in self._unlogged:
+                rec = f'{n}\t{cluster}'
+                if sig is not None:
+                    rec += '\t' + b64encode(sig.astype('<u4').tobytes()).decode('ascii')
+                f.write(f'{rec}\n'.encode('utf-8'))
+            self._log_size = f.tell()
+        self._unlogged = []
+        if self._log_size > os.path.getsize(path):
+            self.save(path)
+
+    @classmethod
+    def load(cls, path: str) -> 'NearDuplicateIndex':
+        """Reads an index written by `save`, with the adds `sync` logged since."""
+        with np.load(path) as data:
+            threshold, num_perm, shingle, seed = data['params']
+            index = cls(float(threshold), int(num_perm), int(shingle), int(seed))
+            for id, sig in zip(data['ids'], data['signatures']):
+                index._index_rep(str(id), sig)
+            index.sizes = dict(zip(map(str, data['size_ids']), map(int, data['size_counts'])))
+            # Files from before adds were numbered.
+            index._added = int(data['added']) if 'added' in data else sum(index.sizes.values())
+        index._unlogged = []
+        if os.path.exists(log_path(path)):
+            with open(log_path(path), 'rb') as f:
+                log = f.read()
+            for line in log.splitlines(keepends=True):
+                if not line.endswith(b'\n'):
+                    break
+                index._log_size += len(line)
+                n, cluster, *sig = line.decode('utf-8').rstrip('\n').split('\t')
+                if int(n) <= index._added:
+                    continue
+                if sig:
+                    index._index_rep(
+                        cluster, np.frombuffer(b64decode(sig[0]), dtype='<u4').astype(np.uint32)
+                    )
+                index.sizes[cluster] = index.sizes.get(cluster, 0) + 1
+                index._added = int(n)
+        return index
+
+
+def log_path(path: str) -> str:
+    """Where `NearDuplicateIndex.sync` logs adds to the index saved at `path`."""
+    return f'{path}.log'
+
+
+def read_clusters(cluster_file: TextIO) -> Dict[str, str]:
+    """Loads a ``<prefix>-clusters.csv`` written by `scrape_until(dedup=...)`.
+
+    Returns:
+        Dict[str, str]: Cluster ID keyed by the stigma-CSV style post ID
+            ('Submission <id>'/'Comment <id>'); representatives map to
+            themselves.
+    """
+    return {row['ID']: row['cluster'] for row in DictReader(cluster_file)}
@@ -0,0 +1,228 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def iterative_stratification(
+    Y: np.ndarray,
+    k: int = 5,
+    seed: Optional[int] = None
+) -> np.ndarray:
+    """Assigns rows of a multi-label matrix to `k` folds.
+
+    Uses the iterative stratification of Sechidis et al. (2011): the rarest
+    remaining label is distributed first, each of its rows going to the fold
+    that most lacks that label, so every fold ends up with close to 1/k of
+    each label's positives, rare Stig/Challn cues included.
+
+    Args:
+        Y (np.ndarray): Binary label matrix (MultiLabelBinarizer output).
+        k (int, optional): Number of folds. By default 5.
+        seed (int, optional): Seed for tie-breaking.
+
+    Returns:
+        np.ndarray: The fold (0..k-1) of each row.
+    """
+    Y = np.asarray(Y).astype(bool)
+    rng = np.random.default_rng(seed)
+    n, n_labels = Y.shape
+    fold = np.full(n, -1, dtype=np.int64)
+    want_rows = np.full(k, n / k)
+    want_labels = np.outer(np.full(k, 1 / k), Y.sum(axis=0)).astype(float)
+    remaining = Y.copy()
+
+    while remaining.any():
+        counts = remaining.sum(axis=0)
+        label = np.where(counts > 0, counts, np.inf).argmin()
+        rows = np.flatnonzero(remaining[:, label])
+        for row in rng.permutation(rows):
+            need = want_labels[:, label]
+            cand = np.flatnonzero(need == need.max())
+            if len(cand) > 1:
+                cand = cand[want_rows[cand] == want_rows[cand].max()]
+            f = rng.choice(cand)
+            fold[row] = f
+            want_labels[f] -= Y[row]
+            want_rows[f] -= 1
+            remaining[row] = False
+
+    for row in rng.permutation(np.flatnonzero(fold < 0)):
+        f = want_rows.argmax()
+        fold[row] = f
+        want_rows[f] -= 1
+    return fold
+
+
+def confusion_counts(
+    y_true: np.ndarray,
+    y_pred: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Per-label true positives, false positives and false negatives."""
+    y_true = np.asarray(y_true).astype(bool)
+    y_pred = np.asarray(y_pred).astype(bool)
+    tp = (y_true & y_pred).sum(axis=0)
+    fp = (~y_true & y_pred).sum(axis=0)
+    fn = (y_true & ~y_pred).sum(axis=0)
+    return tp, fp, fn
+
+
+def _ratio(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    num, den = np.asarray(num, dtype=float), np.asarray(den, dtype=float)
+    return np.divide(num, den, out=np.zeros_like(num), where=den > 0)
+
+
+def hamming_loss(y_true: np.ndarray, y_pred: np.ndarray) -> float:
+    return float((np.asarray(y_true).astype(bool) != np.asarray(y_pred).astype(bool)).mean())
+
+
+def micro_f1(y_true: np.ndarray, y_pred: np.ndarray) -> float:
+    tp, fp, fn = (c.sum() for c in confusion_counts(y_true, y_pred))
+    return float(_ratio(2 * tp, 2 * tp + fp + fn))
+
+
+def multilabel_report(
+    y_true: np.ndarray,
+    y_prob: np.ndarray,
+    labels: Sequence[str],
+    threshold: float = .5
+) -> pd.DataFrame:
+    """Vectorized replacement for `classification_report` on multi-label data.
+
+    Args:
+        y_true (np.ndarray): Binary label matrix.
+        y_prob (np.ndarray): Predicted probabilities (or binary predictions).
+        labels (Sequence[str]): Column names, e.g. `mlb.classes_`.
+        threshold (float, optional): Probability at which a label is
+            predicted. By default .5.
+
+    Returns:
+        pd.DataFrame: precision/recall/f1/support per label, plus 'micro'
+            and 'macro' averages and a 'hamming_loss' column.
+    """
+    y_pred = np.asarray(y_prob) >= threshold
+    tp, fp, fn = confusion_counts(y_true, y_pred)
+    precision = _ratio(tp, tp + fp)
+    recall = _ratio(tp, tp + fn)
+    f1 = _ratio(2 * tp, 2 * tp + fp + fn)
+    report = pd.DataFrame(
+        {
+            'precision': precision,
+            'recall': recall,
+            'f1': f1,
+            'support': tp + fn,
+        },
+        index=list(labels)
+    )
+    TP, FP, FN = tp.sum(), fp.sum(), fn.sum()
+    report.loc['micro'] = [
+        _ratio(TP, TP + FP), _ratio(TP, TP + FN), _ratio(2 * TP, 2 * TP + FP + FN), TP + FN
+    ]
+    report.loc['macro'] = [
+        precision.mean(), recall.mean(), f1.mean(), TP + FN
+    ]
+    report['hamming_loss'] = hamming_loss(y_true, y_pred)
+    return report
+
+
+def cross_validate(
+    experiments,
+    X: Sequence[str],
+    Y: np.ndarray,
+    labels: Sequence[str],
+    k: int = 5,
+    cache_dir: str = 'data/cv',
+    seed: Optional[int] = 0,
+    workers: Optional[int] = None,
+    threads_per_worker: int = 2,
+    epochs: int = 50,
+    patience: int = 5,
+    featurizer_params: Optional[Dict[str, dict]] = None,
+    val_fraction: Optional[float] = None
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Stratified K-fold evaluation of `experiments.Experiment`s.
+
+    Folds are computed once with `iterative_stratification` and each fold's
+    featurized data is cached under `cache_dir/fold_<i>` (reused on later
+    calls with the same data), so featurization is paid once per fold and
+    featurizer, not once per model. All folds x experiments train in
+    parallel worker processes. Within each fold, featurizers are fitted and
+    early stopping is done on the training folds only (see
+    `experiments.prepare`), so the held-out fold is only scored. A model
+    that fails on a fold is recorded in an 'error' column of that fold's
+    row instead of aborting the run, and left out of the summary.
+
+    Args:
+        experiments (List[Experiment]): Configurations to evaluate.
+        X (Sequence[str]): Raw texts.
+        Y (np.ndarray): Binary label matrix.
+        labels (Sequence[str]): Column names of `Y`.
+        k (int, optional): Number of folds.
+        cache_dir (str, optional): Root of the fold cache.
+        seed (int, optional): Seed for the fold assignment and the
+            validation splits.
+        workers, threads_per_worker, epochs, patience, featurizer_params,
+        val_fraction: As for `experiments.run_grid`.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: Per-fold reports (indexed by
+            experiment, fold and label), and their mean/std across folds.
+    """
+    from .experiments import VAL_FRACTION, limit_threads, prepare, run_experiment, thread_env
+
+    X = np.asarray(list(X), dtype=object)
+    Y = np.asarray(Y)
+    folds = iterative_stratification(Y, k, seed)
+    featurizers = sorted({e.featurizer for e in experiments})
+
+    fold_dirs, prepared = [], []
+    for i in range(k):
+        fold_dir = os.path.join(cache_dir, f'fold_{i}')
+        train, test = folds != i, folds == i
+        prepared.append(
+            prepare(fold_dir, featurizers, X[train], X[test], Y[train], Y[test],
+                    featurizer_params, val_fraction or VAL_FRACTION, seed)
+        )
+        fold_dirs.append(fold_dir)
+
+    workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+    with thread_env(threads_per_worker), ProcessPoolExecutor(
+        max_workers=min(workers, k * len(experiments)),
+        mp_context=mp.get_context('spawn'),
+        initializer=limit_threads,
+        initargs=(threads_per_worker, )
+    ) as pool:
+        futures = [
+            (e.name, i, pool.submit(
+                run_experiment, e, fold_dirs[i], prepared[i], epochs, patience, True
+            ))
+            for e in experiments for i in range(k)
+        ]
+        reports: List[pd.DataFrame] = []
+        for name, i, fut in futures:
+            try:
+                result = fut.result()
+            except Exception as e:
+                reports.append(pd.DataFrame({
+                    'label': [None],
+                    'error': [f'{type(e).__name__}: {e}'],
+                    'experiment': [name],
+                    'fold': [i],
+                }).set_index('label'))
+                continue
+            report = multilabel_report(Y[folds == i], result['y_prob'], labels)
+            report.index.name = 'label'
+            reports.append(report.assign(experiment=name, fold=i))
+
+    per_fold = pd.concat(reports).reset_index().set_index(['experiment', 'fold', 'label'])
+    scored = per_fold
+    if 'error' in per_fold:
+        scored = per_fold[per_fold['error'].isna()].drop(columns='error')
+    summary = (
+        scored.groupby(level=['experiment', 'label'], sort=False).agg(['mean', 'std'])
+        if len(scored) else pd.DataFrame()
+    )
+    return per_fold, summary
@@ -0,0 +1,468 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from hashlib import blake2b
+from itertools import product
+import json
+import multiprocessing as mp
+import os
+from time import perf_counter
+from typing import Any, Callable, Dict, Final, Generator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+# Featurizers producing padded token sequences; everything else is a CSR
+# matrix. Architectures declare which of the two they take.
+SEQUENCE_FEATURIZERS: Final[List[str]] = ['tokenized']
+SEQUENCE_ARCHITECTURES: Final[List[str]] = ['tokenized', 'tokenized_conv']
+THREAD_VARS: Final[List[str]] = [
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'TF_NUM_INTRAOP_THREADS',
+    'TF_NUM_INTEROP_THREADS',
+]
+
+# Share of the training rows held out (stratified) for early stopping.
+VAL_FRACTION: Final[float] = .1
+# Hashed columns for the grid: `hashing.N_FEATURES` (2**20) would give the
+# first 1000-unit layer of `counts_sequential` ~1e9 weights per worker.
+GRID_N_FEATURES: Final[int] = 2**16
+
+Features = Union[np.ndarray, csr_matrix]
+
+
+# Featurizers are fitted on X_train only and applied to both, so nothing
+# about the held-out texts (vocabulary, IDF, sequence length) leaks into
+# training.
+def featurize_counts(X_train, X_test, **kwargs) -> Tuple[Features, Features, dict]:
+    from sklearn.feature_extraction.text import CountVectorizer
+    counts = CountVectorizer(
+        stop_words='english', strip_accents='ascii', ngram_range=(1, 3), **kwargs
+    ).fit(list(X_train))
+    return counts.transform(X_train), counts.transform(X_test), {}
+
+
+def featurize_tfidf(X_train, X_test, **kwargs) -> Tuple[Features, Features, dict]:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    tfidf = TfidfVectorizer(
+        stop_words='english', strip_accents='ascii', ngram_range=(1, 3), **kwargs
+    ).fit(list(X_train))
+    return tfidf.transform(X_train), tfidf.transform(X_test), {}
+
+
+def featurize_hashing(
+    X_train,
+    X_test,
+    n_features: int = GRID_N_FEATURES,
+    **kwargs
+) -> Tuple[Features, Features, dict]:
+    from .hashing import HashingFeaturizer, StreamingTfidf
+    with HashingFeaturizer(n_features, **kwargs) as featurizer:
+        tfidf = StreamingTfidf(featurizer.n_features)
+        train = tfidf.partial_fit_transform(featurizer.transform(list(X_train)))
+        return train, tfidf.transform(featurizer.transform(list(X_test))), {}
+
+
+def featurize_tokenized(
+    X_train,
+    X_test,
+    maxlen: Optional[int] = None
+) -> Tuple[Features, Features, dict]:
+    from keras.preprocessing.sequence import pad_sequences
+    from keras.preprocessing.text import Tokenizer
+    texts = list(X_train)
+    maxlen = maxlen or max(len(t.split()) for t in texts)
+    tokenizer = Tokenizer()
+    tokenizer.fit_on_texts(texts)
+    pad = lambda X: pad_sequences(
+        tokenizer.texts_to_sequences(list(X)), maxlen=maxlen, padding='post'
+    )
+    info = {'vocab_size': len(tokenizer.word_index) + 1, 'maxlen': maxlen}
+    return pad(X_train), pad(X_test), info
+
+
+FEATURIZERS: Final[Dict[str, Callable[..., Tuple[Features, Features, dict]]]] = {
+    'counts': featurize_counts,
+    'tfidf': featurize_tfidf,
+    'hashing': featurize_hashing,
+    'tokenized': featurize_tokenized,
+}
+
+
+def build_model(architecture: str, info: dict, n_labels: int, **params):
+    """Builds one of the analysis.ipynb architectures for featurized input.
+
+    Vector architectures take CSR input through `SparseDense`.
+    """
+    from .neural import counts_sequential, tokenized_sequential
+    if architecture == 'counts':
+        return counts_sequential(info['n_features'], n_labels, **params)
+    if architecture == 'tfidf':
+        params.setdefault('units', (50, ))
+        params.setdefault('learning_rate', .001)
+        return counts_sequential(
+            info['n_features'], n_labels, name='sequential_tfidf', **params
+        )
+    if architecture == 'tokenized':
+        return tokenized_sequential(
+            info['vocab_size'], info['maxlen'], n_labels, **params
+        )
+    if architecture == 'tokenized_conv':
+        params.setdefault('conv_filters', 256)
+        return tokenized_sequential(
+            info['vocab_size'],
+            info['maxlen'],
+            n_labels,
+            name='sequential_tokenized_conv',
+            **params
+        )
+    raise ValueError(f'Unknown architecture {architecture}')
+
+
+@dataclass
+class Experiment:
+    """One cell of the comparison grid.
+
+    Attributes:
+        featurizer (str): Key of `FEATURIZERS`.
+        architecture (str): Architecture name accepted by `build_model`.
+        params (dict): Keyword arguments for the architecture builder.
+        batch_size (int): Training batch size.
+    """
+    featurizer: str
+    architecture: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    batch_size: int = 32
+
+    @property
+    def name(self) -> str:
+        params = {**self.params, 'batch_size': self.batch_size}
+        params = ','.join(f'{k}={v}' for k, v in sorted(params.items()))
+        return f'{self.featurizer}/{self.architecture}[{params}]'
+
+
+def grid(
+    featurizers: Sequence[str],
+    architectures: Sequence[str],
+    batch_sizes: Sequence[int] = (32, ),
+    **params: Sequence[Any]
+) -> List[Experiment]:
+    """Every compatible featurizer x architecture x hyperparameter combination.
+
+    Hyperparameters are given as lists of values, e.g.
+    ``grid(['counts', 'tfidf'], ['counts', 'tfidf'], learning_rate=[1e-3, 1e-4])``.
+    """
+    keys = sorted(params)
+    experiments = []
+    for feat, arch, bs, *values in product(
+        featurizers, architectures, batch_sizes, *(params[k] for k in keys)
+    ):
+        if (feat in SEQUENCE_FEATURIZERS) != (arch in SEQUENCE_ARCHITECTURES):
+            continue
+        experiments.append(Experiment(feat, arch, dict(zip(keys, values)), bs))
+    return experiments
+
+
+def save_shared(path: str, X: Features) -> dict:
+    """Writes features as .npy files that workers can memory-map."""
+    os.makedirs(path, exist_ok=True)
+    if isinstance(X, np.ndarray):
+        np.save(os.path.join(path, 'dense.npy'), X)
+        return {'kind': 'dense', 'shape': list(X.shape)}
+    X = csr_matrix(X, dtype=np.float32)
+    X.sort_indices()
+    for part in ('data', 'indices', 'indptr'):
+        np.save(os.path.join(path, f'{part}.npy'), getattr(X, part))
+    return {'kind': 'csr', 'shape': list(X.shape)}
+
+
+def load_shared(path: str, meta: dict) -> Features:
+    load = lambda part: np.load(os.path.join(path, f'{part}.npy'), mmap_mode='r')
+    if meta['kind'] == 'dense':
+        return load('dense')
+    return csr_matrix(
+        (load('data'), load('indices'), load('indptr')),
+        shape=tuple(meta['shape']),
+        copy=False
+    )
+
+
+def validation_split(
+    y_train: np.ndarray,
+    val_fraction: float = VAL_FRACTION,
+    seed: Optional[int] = 0
+) -> np.ndarray:
+    """Mask of the training rows held out for early stopping.
+
+    One fold of an `evaluation.iterative_stratification` of the training
+    labels, so rare labels are represented in the held-out rows too.
+    """
+    from .evaluation import iterative_stratification
+
+    k = max(2, round(1 / val_fraction))
+    return iterative_stratification(y_train, k, seed) == 0
+
+
+def prepare(
+    cache_dir: str,
+    featurizers: Sequence[str],
+    X_train,
+    X_test,
+    y_train: np.ndarray,
+    y_test: np.ndarray,
+    featurizer_params: Optional[Dict[str, dict]] = None,
+    val_fraction: float = VAL_FRACTION,
+    seed: Optional[int] = 0
+) -> Dict[str, dict]:
+    """Featurizes once per featurizer and caches the results for the workers.
+
+    A stratified `val_fraction` of the training rows is held out (see
+    `validation_split`) for early stopping, so the test rows are only ever
+    used for the reported scores. Featurizers are fitted on the remaining
+    training rows and applied to the held-out and test rows. Featurizers
+    already cached in `cache_dir` for the same texts, labels, split and
+    parameters are reused rather than refitted.
+
+    Returns:
+        Dict[str, dict]: Per featurizer, the cache layout and the model input
+            info (`n_features`, or `vocab_size`/`maxlen`).
+    """
+    featurizer_params = featurizer_params or {}
+    os.makedirs(cache_dir, exist_ok=True)
+    X_train = np.asarray(list(X_train), dtype=object)
+    X_test = list(X_test)
+    y_train = np.asarray(y_train, dtype=np.float32)
+    val = validation_split(y_train, val_fraction, seed)
+    np.save(os.path.join(cache_dir, 'y_train.npy'), y_train[~val])
+    np.save(os.path.join(cache_dir, 'y_val.npy'), y_train[val])
+    np.save(os.path.join(cache_dir, 'y_test.npy'), np.asarray(y_test, dtype=np.float32))
+
+    digest = blake2b(digest_size=16)
+    for part in (X_train, X_test):
+        for t in part:
+            digest.update(str(t).encode('utf-8') + b'\0')
+        digest.update(b'\1')
+    digest.update(np.ascontiguousarray(y_train).tobytes())
+    digest.update(val.tobytes())
+    fingerprint = digest.hexdigest()
+
+    manifest = os.path.join(cache_dir, 'prepared.json')
+    cached = {}
+    if os.path.exists(manifest):
+        with open(manifest, 'r') as f:
+            cached = json.load(f)
+
+    n_val = int(val.sum())
+    prepared = {}
+    for name in featurizers:
+        params = featurizer_params.get(name, {})
+        hit = cached.get(name)
+        # Compare as stored: JSON turns tuples such as ngram_range into lists.
+        if (
+            hit and hit.get('fingerprint') == fingerprint
+            and hit.get('params') == json.loads(json.dumps(params))
+        ):
+            prepared[name] = hit
+            continue
+        # Held-out and test rows go through the fitted featurizer together.
+        train, held, info = FEATURIZERS[name](
+            X_train[~val], list(X_train[val]) + X_test, **params
+        )
+        info.setdefault('n_features', train.shape[1])
+        held = csr_matrix(held) if not isinstance(held, np.ndarray) else held
+        prepared[name] = {
+            'train': save_shared(os.path.join(cache_dir, name, 'train'), train),
+            'val': save_shared(os.path.join(cache_dir, name, 'val'), held[:n_val]),
+            'test': save_shared(os.path.join(cache_dir, name, 'test'), held[n_val:]),
+            'info': info,
+            'fingerprint': fingerprint,
+            'params': params,
+        }
+    with open(manifest, 'w') as f:
+        json.dump({**cached, **prepared}, f, indent=4)
+    return prepared
+
+
+@contextmanager
+def thread_env(threads: int) -> Generator[None, None, None]:
+    """Sets thread-count variables that processes spawned inside inherit.
+
+    BLAS/OpenMP read these when first loaded, which in a worker happens while
+    unpickling its first task, so they have to be in place before spawning.
+    """
+    saved = {var: os.environ.get(var) for var in THREAD_VARS}
+    os.environ.update({var: str(threads) for var in THREAD_VARS})
+    try:
+        yield
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var)
+            else:
+                os.environ[var] = value
+
+
+def limit_threads(threads: int) -> None:
+    """Caps TensorFlow's thread pools in a worker process."""
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def run_experiment(
+    experiment: Experiment,
+    cache_dir: str,
+    prepared: Dict[str, dict],
+    epochs: int = 50,
+    patience: int = 5,
+    return_probs: bool = False
+) -> dict:
+    """Trains and evaluates one configuration against the shared features.
+
+    Early stopping watches the loss on the validation rows held out of the
+    training data by `prepare`; the test rows are only predicted once
+    training is done. With `return_probs` the test-set probabilities are included under
+    'y_prob' for evaluation by the caller.
+    """
+    from keras.callbacks import EarlyStopping
+
+    from .evaluation import hamming_loss, micro_f1
+    from .neural import fit_sparse, predict_sparse
+
+    feat = prepared[experiment.featurizer]
+    base = os.path.join(cache_dir, experiment.featurizer)
+    X_train = load_shared(os.path.join(base, 'train'), feat['train'])
+    X_val = load_shared(os.path.join(base, 'val'), feat['val'])
+    X_test = load_shared(os.path.join(base, 'test'), feat['test'])
+    y_train = np.load(os.path.join(cache_dir, 'y_train.npy'), mmap_mode='r')
+    y_val = np.load(os.path.join(cache_dir, 'y_val.npy'), mmap_mode='r')
+    y_test = np.load(os.path.join(cache_dir, 'y_test.npy'), mmap_mode='r')
+
+    model = build_model(
+        experiment.architecture,
+        feat['info'],
+        y_train.shape[1],
+        **experiment.params
+    )
+    stop = EarlyStopping(patience=patience, restore_best_weights=True)
+    start = perf_counter()
+    if feat['train']['kind'] == 'csr':
+        hist = fit_sparse(
+            model,
+            X_train,
+            y_train,
+            validation_data=(X_val, y_val),
+            batch_size=experiment.batch_size,
+            epochs=epochs,
+            callbacks=[stop],
+            verbose=0
+        )
+        y_prob = predict_sparse(model, X_test)
+    else:
+        hist = model.fit(
+            X_train,
+            y_train,
+            validation_data=(X_val, y_val),
+            batch_size=experiment.batch_size,
+            epochs=epochs,
+            callbacks=[stop],
+            verbose=0
+        )
+        y_prob = model.predict(X_test)
+    elapsed = perf_counter() - start
+
+    y_pred = np.asarray(y_prob) >= .5
+    result = {
+        'experiment': experiment.name,
+        **asdict(experiment),
+        'epochs_run': len(hist.history['loss']),
+        'train_seconds': elapsed,
+        'val_loss': min(hist.history['val_loss']),
+        'val_accuracy': max(hist.history.get('val_accuracy', [np.nan])),
+        'micro_f1': micro_f1(y_test, y_pred),
+        'hamming_loss': hamming_loss(y_test, y_pred),
+    }
+    if return_probs:
+        result['y_prob'] = np.asarray(y_prob)
+    return result
+
+
+def run_grid(
+    experiments: List[Experiment],
+    X_train,
+    X_test,
+    y_train: np.ndarray,
+    y_test: np.ndarray,
+    cache_dir: str = 'data/experiments',
+    workers: Optional[int] = None,
+    threads_per_worker: int = 2,
+    epochs: int = 50,
+    patience: int = 5,
+    featurizer_params: Optional[Dict[str, dict]] = None,
+    val_fraction: float = VAL_FRACTION,
+    seed: Optional[int] = 0
+) -> pd.DataFrame:
+    """Runs a grid of experiments concurrently and tabulates the results.
+
+    Each featurizer is fitted once and its output is memory-mapped by every
+    worker that needs it. Workers are fresh (spawned) processes, each limited
+    to `threads_per_worker` threads, so by default the grid fills the machine
+    and a full sweep takes about as long as its slowest model.
+
+    Args:
+        experiments (List[Experiment]): Configurations, e.g. from `grid`.
+        X_train, X_test: Raw texts.
+        y_train, y_test (np.ndarray): MultiLabelBinarizer output.
+        cache_dir (str, optional): Where featurized inputs are cached.
+        workers (int, optional): Worker processes. Defaults to
+            cpu_count // threads_per_worker.
+        threads_per_worker (int, optional): Thread cap per worker.
+        epochs (int, optional): Maximum epochs per model.
+        patience (int, optional): EarlyStopping patience on val_loss.
+        featurizer_params (dict, optional): Keyword arguments per featurizer.
+        val_fraction (float, optional): Share of the training rows held out
+            for early stopping; see `prepare`.
+        seed (int, optional): Seed for the validation split.
+
+    Returns:
+        pd.DataFrame: One row per experiment, best val_loss first.
+    """
+    prepared = prepare(
+        cache_dir,
+        sorted({e.featurizer for e in experiments}),
+        X_train,
+        X_test,
+        y_train,
+        y_test,
+        featurizer_params,
+        val_fraction,
+        seed
+    )
+    workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+
+    with thread_env(threads_per_worker), ProcessPoolExecutor(
+        max_workers=min(workers, len(experiments)),
+        mp_context=mp.get_context('spawn'),
+        initializer=limit_threads,
+        initargs=(threads_per_worker, )
+    ) as pool:
+        futures = [
+            (e, pool.submit(run_experiment, e, cache_dir, prepared, epochs, patience))
+            for e in experiments
+        ]
+        results = []
+        for experiment, fut in futures:
+            try:
+                results.append(fut.result())
+            except Exception as e:
+                results.append({
+                    'experiment': experiment.name,
+                    **asdict(experiment),
+                    'error': f'{type(e).__name__}: {e}',
+                })
+
+    table = pd.DataFrame(results).set_index('experiment')
+    return table.sort_values('val_loss') if 'val_loss' in table else table
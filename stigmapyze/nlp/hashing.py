@@ -0,0 +1,172 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Final, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix, diags, vstack
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+N_FEATURES: Final[int] = 2**20
+CHUNKSIZE: Final[int] = 10000
+
+
+class HashingFeaturizer:
+    """Stateless n-gram counts hashed into a fixed number of columns.
+
+    A drop-in for the `CountVectorizer(ngram_range=(1, 3))` used in
+    analysis.ipynb: same tokenization options, but nothing is fitted, so
+    memory and model input width are set by `n_features` instead of by the
+    vocabulary of the corpus, and new batches can be featurized at any time.
+
+    Attributes:
+        n_features (int): Number of output columns.
+        ngram_range (Tuple[int, int]): Smallest and largest n-gram size.
+        n_jobs (int): Worker processes used by `transform` for large inputs.
+            The pool is started on first use and kept until `close`, so
+            `transform_batches` doesn't start one per batch.
+        chunksize (int): Documents per worker task.
+    """
+
+    def __init__(
+        self,
+        n_features: int = N_FEATURES,
+        ngram_range: Tuple[int, int] = (1, 3),
+        stop_words: Optional[str] = 'english',
+        strip_accents: Optional[str] = 'ascii',
+        lowercase: bool = True,
+        binary: bool = False,
+        n_jobs: int = 1,
+        chunksize: int = CHUNKSIZE
+    ) -> None:
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self._vectorizer = HashingVectorizer(
+            n_features=n_features,
+            ngram_range=ngram_range,
+            stop_words=stop_words,
+            strip_accents=strip_accents,
+            lowercase=lowercase,
+            binary=binary,
+            alternate_sign=False,
+            norm=None,
+            dtype=np.float32,
+        )
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> 'HashingFeaturizer':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __getstate__(self) -> dict:
+        # The pool can't be pickled; a copy starts its own when needed.
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def transform(self, texts: Sequence[str]) -> csr_matrix:
+        """Featurizes texts, spreading chunks over `n_jobs` processes."""
+        if self.n_jobs == 1 or len(texts) <= self.chunksize:
+            return _transform(self._vectorizer, texts)
+
+        chunks = [
+            texts[i:i + self.chunksize]
+            for i in range(0, len(texts), self.chunksize)
+        ]
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.n_jobs)
+        parts = list(
+            self._pool.map(_transform, [self._vectorizer] * len(chunks), chunks)
+        )
+        return vstack(parts, format='csr')
+
+    def transform_batches(
+        self,
+        batches: Iterable[Sequence[str]]
+    ) -> Iterator[csr_matrix]:
+        for batch in batches:
+            yield self.transform(batch)
+
+
+def _transform(vectorizer: HashingVectorizer, texts: Sequence[str]) -> csr_matrix:
+    X = vectorizer.transform(texts)
+    X.sort_indices()
+    return X
+
+
+class StreamingTfidf:
+    """TF-IDF weighting whose document frequencies are updated batch by batch.
+
+    Memory is one counter per hashed column regardless of how many documents
+    have been seen. IDF follows scikit-learn's formula, so once every batch
+    has passed through `partial_fit` the output matches `TfidfTransformer`
+    fitted on the whole corpus.
+
+    Attributes:
+        df (np.ndarray): Number of documents seen containing each column.
+        n_docs (int): Number of documents seen.
+    """
+
+    def __init__(
+        self,
+        n_features: int = N_FEATURES,
+        norm: Optional[str] = 'l2',
+        smooth_idf: bool = True,
+        sublinear_tf: bool = False
+    ) -> None:
+        self.norm = norm
+        self.smooth_idf = smooth_idf
+        self.sublinear_tf = sublinear_tf
+        self.df = np.zeros(n_features, dtype=np.int64)
+        self.n_docs = 0
+
+    def partial_fit(self, X: csr_matrix) -> 'StreamingTfidf':
+        X = csr_matrix(X)
+        X.sum_duplicates()
+        self.df += np.bincount(X.indices, minlength=len(self.df))
+        self.n_docs += X.shape[0]
+        return self
+
+    @property
+    def idf(self) -> np.ndarray:
+        smooth = int(self.smooth_idf)
+        return (
+            np.log((self.n_docs + smooth) / np.maximum(self.df + smooth, 1)) + 1
+        ).astype(np.float32)
+
+    def transform(self, X: csr_matrix) -> csr_matrix:
+        X = csr_matrix(X, dtype=np.float32, copy=True)
+        if self.sublinear_tf:
+            np.log(X.data, out=X.data)
+            X.data += 1
+        X = X @ diags(self.idf, format='csr')
+        if self.norm:
+            X = normalize(X, norm=self.norm, copy=False)
+        return X
+
+    def partial_fit_transform(self, X: csr_matrix) -> csr_matrix:
+        return self.partial_fit(X).transform(X)
+
+
+def hashed_tfidf(
+    texts: List[str],
+    featurizer: Optional[HashingFeaturizer] = None,
+    tfidf: Optional[StreamingTfidf] = None
+) -> Tuple[csr_matrix, HashingFeaturizer, StreamingTfidf]:
+    """Fixed-width replacement for `TfidfVectorizer(...).fit_transform`.
+
+    Returns the matrix along with the featurizer and (updated) statistics so
+    later batches can be weighted the same way.
+    """
+    featurizer = featurizer or HashingFeaturizer()
+    tfidf = tfidf or StreamingTfidf(featurizer.n_features)
+    X = featurizer.transform(texts)
+    return tfidf.partial_fit_transform(X), featurizer, tfidf
@@ -0,0 +1,375 @@
+import json
+import os
+from typing import Dict, Final, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+NPROBE: Final[int] = 8
+KMEANS_ITERS: Final[int] = 10
+# k-means trains on this many sampled rows per inverted list.
+SAMPLE_PER_LIST: Final[int] = 64
+# Rows scored per matrix product, which bounds the (queries, rows) score block.
+BLOCK: Final[int] = 2**16
+GROW: Final[int] = 1024
+VECTORS: Final[str] = 'vectors.f32'
+IDS: Final[str] = 'ids.txt'
+CENTROIDS: Final[str] = 'centroids.npy'
+ASSIGNMENTS: Final[str] = 'lists.npy'
+META: Final[str] = 'meta.json'
+
+Neighbors = List[Tuple[str, float]]
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Rows of `vectors` scaled to unit length, as float32; zero rows stay zero."""
+    v = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.sqrt((v**2).sum(axis=1, keepdims=True))
+    norms[norms == 0] = 1
+    return v / norms
+
+
+def _merge(
+    best_scores: np.ndarray,
+    best_rows: np.ndarray,
+    scores: np.ndarray,
+    rows: np.ndarray,
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    # Keeps the k highest of the running best and a new block, unordered.
+    s = np.hstack([best_scores, scores])
+    r = np.hstack([best_rows, np.broadcast_to(rows, scores.shape)])
+    if s.shape[1] > k:
+        part = np.argpartition(-s, k - 1, axis=1)[:, :k]
+        s, r = np.take_along_axis(s, part, 1), np.take_along_axis(r, part, 1)
+    return s, r
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return np.concatenate([
+        (vectors[i:i + BLOCK] @ centroids.T).argmax(axis=1)
+        for i in range(0, len(vectors), BLOCK)
+    ] or [np.zeros(0, dtype=np.int64)])
+
+
+class VectorIndex:
+    """Cosine-similarity search over post embeddings, e.g. `vec.sentence_vecs`.
+
+    Vectors are stored L2-normalized in one contiguous float32 matrix, so a
+    similarity is a dot product and a batch of queries is scored with one
+    matrix product per block of rows. Rows loaded from disk stay memory-mapped
+    and new rows go to an in-memory buffer that doubles as it fills, so
+    inserting as posts arrive doesn't copy the saved matrix, and `save` only
+    appends the buffer to the file.
+
+    Exact search scans every row. After `train`, queries are approximate:
+    rows are partitioned into inverted lists around spherical k-means
+    centroids (IVF), and a query only scores the rows of its `nprobe`
+    nearest lists. With the default 4 * sqrt(n) lists and 8 probes that is
+    about 2 * sqrt(n) rows instead of n, which keeps queries over millions
+    of posts in milliseconds. Rows added after training join their nearest
+    list; retrain when the corpus has drifted a lot. `search(..., exact=True)`
+    always scans everything and is the reference for recall.
+
+    Attributes:
+        dim (int): Vector size.
+        nprobe (int): Inverted lists scanned per approximate query.
+        ids (List[str]): Row ids, in insertion order.
+        centroids (np.ndarray, optional): (nlist, dim) list centroids, once trained.
+    """
+
+    def __init__(self, dim: int, nprobe: int = NPROBE) -> None:
+        self.dim = dim
+        self.nprobe = nprobe
+        self.ids: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        self._pos: Dict[str, int] = {}
+        self._base: np.ndarray = np.zeros((0, dim), dtype=np.float32)
+        self._buf: np.ndarray = np.zeros((0, dim), dtype=np.float32)
+        self._n_buf = 0
+        self._lists: List[np.ndarray] = []
+        self._pending: List[List[int]] = []
+        self._path: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self._pos
+
+    @property
+    def nlist(self) -> int:
+        return 0 if self.centroids is None else len(self.centroids)
+
+    def _segments(self) -> Iterator[Tuple[int, np.ndarray]]:
+        yield 0, self._base
+        yield len(self._base), self._buf[:self._n_buf]
+
+    def _rows(self, rows: np.ndarray) -> np.ndarray:
+        # `rows` sorted, so reads from the memory map go forward through the file.
+        split = np.searchsorted(rows, len(self._base))
+        return np.vstack([
+            self._base[rows[:split]],
+            self._buf[rows[split:] - len(self._base)],
+        ])
+
+    def vector(self, id: str) -> np.ndarray:
+        return self._rows(np.array([self._pos[id]]))[0]
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray) -> int:
+        """Inserts a batch of vectors; ids already in the index are skipped.
+
+        Returns:
+            int: Number of rows added.
+        """
+        vectors = normalize(vectors)
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f'Expected {len(ids)} vectors of size {self.dim}, got {vectors.shape}')
+        keep, seen = [], set()
+        for i, id in enumerate(ids):
+            if id not in self._pos and id not in seen:
+                keep.append(i)
+                seen.add(id)
+        if not keep:
+            return 0
+        vectors = vectors[keep]
+
+        need = self._n_buf + len(keep)
+        if need > len(self._buf):
+            buf = np.empty((max(need, 2 * len(self._buf), GROW), self.dim), dtype=np.float32)
+            buf[:self._n_buf] = self._buf[:self._n_buf]
+            self._buf = buf
+        self._buf[self._n_buf:need] = vectors
+        self._n_buf = need
+
+        start = len(self.ids)
+        for row, i in enumerate(keep, start):
+            self._pos[ids[i]] = row
+            self.ids.append(ids[i])
+        if self.centroids is not None:
+            for row, l in enumerate(_assign(vectors, self.centroids), start):
+                self._pending[l].append(row)
+        return len(keep)
+
+    def add_texts(
+        self,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        words: Dict[str, int],
+        matrix: np.ndarray
+    ) -> int:
+        """`add` with the texts' `vec.sentence_vecs` embeddings."""
+        from .vec import sentence_vecs
+
+        return self.add(ids, sentence_vecs(texts, words, matrix))
+
+    def train(
+        self,
+        nlist: Optional[int] = None,
+        iters: int = KMEANS_ITERS,
+        seed: int = 0
+    ) -> None:
+        """Builds inverted lists with spherical k-means on a sample of the rows.
+
+        Args:
+            nlist (int, optional): Number of lists; defaults to 4 * sqrt(n).
+            iters (int, optional): k-means iterations.
+            seed (int, optional): Seed for sampling and initialization.
+        """
+        n = len(self)
+        if not n:
+            raise ValueError('Cannot train an empty index')
+        nlist = min(n, nlist or max(1, int(4 * np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        sample = self._rows(np.sort(rng.choice(n, min(n, nlist * SAMPLE_PER_LIST), replace=False)))
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(iters):
+            assign = _assign(sample, centroids)
+            order = np.argsort(assign, kind='stable')
+            counts = np.bincount(assign, minlength=nlist)
+            filled = counts > 0
+            sums = np.add.reduceat(sample[order], np.cumsum(counts)[filled] - counts[filled])
+            centroids = centroids.copy()
+            centroids[filled] = normalize(sums)
+            # Restart empty lists from random rows rather than losing them.
+            empty = np.flatnonzero(~filled)
+            centroids[empty] = sample[rng.choice(len(sample), len(empty))]
+        self.centroids = centroids
+
+        assign = np.concatenate([_assign(seg, centroids) for _, seg in self._segments()])
+        self._set_lists(assign)
+
+    def _set_lists(self, assign: np.ndarray) -> None:
+        order = np.argsort(assign, kind='stable')
+        bounds = np.cumsum(np.bincount(assign, minlength=self.nlist))[:-1]
+        self._lists = np.split(order, bounds)
+        self._pending = [[] for _ in range(self.nlist)]
+
+    def _list(self, l: int) -> np.ndarray:
+        if self._pending[l]:
+            self._lists[l] = np.concatenate([self._lists[l], self._pending[l]])
+            self._pending[l] = []
+        return self._lists[l]
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int = 10,
+        nprobe: Optional[int] = None,
+        exact: bool = False
+    ) -> List[Neighbors]:
+        """Top-k most similar rows for each query vector.
+
+        Args:
+            queries (np.ndarray): (n_queries, dim), or one (dim,) vector.
+            k (int, optional): Neighbours per query.
+            nprobe (int, optional): Overrides `self.nprobe` for this call.
+            exact (bool, optional): Scan every row even if trained.
+
+        Returns:
+            List[List[Tuple[str, float]]]: (id, cosine similarity) per
+                query, most similar first.
+        """
+        queries = normalize(queries)
+        if exact or self.centroids is None:
+            return self._search_exact(queries, k)
+
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        out = []
+        for query, lists in zip(queries, probes):
+            rows = np.sort(np.concatenate([self._list(l) for l in lists]))
+            scores = self._rows(rows) @ query
+            if len(rows) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                rows, scores = rows[top], scores[top]
+            out.extend(self._ranked(scores[None], rows[None]))
+        return out
+
+    def _search_exact(self, queries: np.ndarray, k: int) -> List[Neighbors]:
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for offset, seg in self._segments():
+            for i in range(0, len(seg), BLOCK):
+                block = seg[i:i + BLOCK]
+                rows = np.arange(offset + i, offset + i + len(block))
+                best_scores, best_rows = _merge(
+                    best_scores, best_rows, queries @ block.T, rows, k
+                )
+        return self._ranked(best_scores, best_rows)
+
+    def _ranked(self, scores: np.ndarray, rows: np.ndarray) -> List[Neighbors]:
+        order = np.argsort(-scores, axis=1, kind='stable')
+        return [
+            [(self.ids[r], float(s)) for r, s in zip(rows[q, o], scores[q, o])]
+            for q, o in enumerate(order)
+        ]
+
+    def similar(self, id: str, k: int = 10, **kwargs) -> Neighbors:
+        """Posts most like an indexed post, excluding itself."""
+        hits = self.search(self.vector(id), k + 1, **kwargs)[0]
+        return [h for h in hits if h[0] != id][:k]
+
+    def save(self, path: str) -> None:
+        """Writes the index to directory `path`.
+
+        Saving back to the directory the index was loaded from appends only
+        the rows added since. The metadata is written last and holds the row
+        count, so an interrupted save leaves the previous index readable.
+        """
+        os.makedirs(path, exist_ok=True)
+        path = os.path.abspath(path)
+        vectors = os.path.join(path, VECTORS)
+        if path == self._path:
+            with open(vectors, 'r+b') as f:
+                # Drops rows an interrupted save may have left past the end.
+                f.truncate(self._base.nbytes)
+                f.seek(0, os.SEEK_END)
+                f.write(self._buf[:self._n_buf].tobytes())
+        else:
+            tmp = f'{vectors}.tmp'
+            with open(tmp, 'wb') as f:
+                for _, seg in self._segments():
+                    for i in range(0, len(seg), BLOCK):
+                        f.write(np.ascontiguousarray(seg[i:i + BLOCK]).tobytes())
+            os.replace(tmp, vectors)
+
+        def write(name: str, save) -> None:
+            tmp = os.path.join(path, f'{name}.tmp')
+            with open(tmp, 'wb') as f:
+                save(f)
+            os.replace(tmp, os.path.join(path, name))
+
+        write(IDS, lambda f: f.write('\n'.join(self.ids).encode('utf-8')))
+        if self.centroids is not None:
+            assign = np.empty(len(self), dtype=np.int32)
+            for l in range(self.nlist):
+                assign[self._list(l)] = l
+            write(CENTROIDS, lambda f: np.save(f, self.centroids))
+            write(ASSIGNMENTS, lambda f: np.save(f, assign))
+        meta = {'dim': self.dim, 'n': len(self), 'nprobe': self.nprobe, 'nlist': self.nlist}
+        write(META, lambda f: f.write(json.dumps(meta, indent=4).encode('utf-8')))
+
+        self._base = self._open_vectors(path, len(self), True)
+        self._buf = np.zeros((0, self.dim), dtype=np.float32)
+        self._n_buf = 0
+        self._path = path
+
+    def _open_vectors(self, path: str, n: int, mmap: bool) -> np.ndarray:
+        vectors = os.path.join(path, VECTORS)
+        if not n:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        if mmap:
+            return np.memmap(vectors, dtype=np.float32, mode='r', shape=(n, self.dim))
+        return np.fromfile(vectors, dtype=np.float32, count=n * self.dim).reshape(n, self.dim)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'VectorIndex':
+        """Opens an index written by `save`.
+
+        Args:
+            path (str): Index directory.
+            mmap (bool, optional): Memory-map the vectors instead of reading
+                them into memory, so opening is instant and the OS pages in
+                only the rows that get scored.
+        """
+        path = os.path.abspath(path)
+        with open(os.path.join(path, META), 'r') as f:
+            meta = json.load(f)
+        index = cls(meta['dim'], meta['nprobe'])
+        n = meta['n']
+        with open(os.path.join(path, IDS), 'r', encoding='utf-8') as f:
+            index.ids = f.read().split('\n')[:n] if n else []
+        index._pos = {id: row for row, id in enumerate(index.ids)}
+        index._base = index._open_vectors(path, n, mmap)
+        if meta['nlist']:
+            index.centroids = np.load(os.path.join(path, CENTROIDS))
+            index._set_lists(np.load(os.path.join(path, ASSIGNMENTS))[:n])
+        if mmap:
+            index._path = path
+        return index
+
+    @classmethod
+    def open(cls, path: str, dim: int, nprobe: int = NPROBE) -> 'VectorIndex':
+        """Loads `path` if it holds an index, else starts an empty one."""
+        if os.path.exists(os.path.join(path, META)):
+            return cls.load(path)
+        return cls(dim, nprobe)
+
+
+def iter_posts(files: Iterable[str], kind: str) -> Iterator[Tuple[str, str]]:
+    """(stigma-CSV style ID, text) of each post in scraped submission or comment CSVs.
+
+    Args:
+        files (Iterable[str]): CSVs written by `scrape_until`.
+        kind (str): 'Submission' or 'Comment'.
+    """
+    from csv import DictReader
+
+    for fp in files:
+        with open(fp, 'r', newline='', encoding='utf-8') as f:
+            for row in DictReader(f):
+                if kind == 'Comment':
+                    text = row['body']
+                else:
+                    text = f'{row["title"]}\n{row["selftext"]}'
+                yield f'{kind} {row["id"]}', text
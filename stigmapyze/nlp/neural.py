@@ -1,4 +1,4 @@
-from typing import Any, Dict, Final, List, Tuple
+from typing import Any, Dict, Final, Generator, List, Optional, Sequence, Tuple
 import os
 
 from keras.callbacks import EarlyStopping
@@ -7,11 +7,14 @@ from keras.layers.core import Dense, Activation, Dropout
 from keras.layers.embeddings import Embedding
 from keras.layers.normalization import BatchNormalization
 from keras.layers.recurrent import LSTM, SimpleRNN
+from keras.losses import BinaryCrossentropy
 from keras.models import Sequential
+from keras.optimizers import Nadam
 from keras.preprocessing import sequence, text
 import numpy as np
+from scipy.sparse import csr_matrix
 import tensorflow as tf
-import tqdm
+from tqdm import tqdm
 
 GLOVE_TXT: Final[str] = os.path.expandvars(
     '${XDG_DATA_HOME}/michael/data-science/glove.840B.300d.txt'
@@ -30,10 +33,10 @@ def sequence_data(X_train, X_test) -> Tuple[np.ndarray, np.ndarray, dict]:
     return X_train_seq, X_test_seq, tokenizer.word_index
 
 
-def load_glove_index(word_index: Dict[Any, int]):
+def load_glove_index(word_index: Dict[Any, int], glove_txt: str = GLOVE_TXT):
     eindex: Dict[str, List[float]] = {}
     ematrix: np.ndarray = np.zeros((len(word_index) + 1, 300))
-    with open(GLOVE_TXT, 'r', encoding='utf-8') as glove:
+    with open(glove_txt, 'r', encoding='utf-8') as glove:
         for line in tqdm(glove):
             values = line.split(' ')
             word, coef = values[0], np.asarray([float(v) for v in values[1:]])
@@ -41,7 +44,7 @@ def load_glove_index(word_index: Dict[Any, int]):
 
     for word, idx in tqdm(word_index.items()):
         coef = eindex.get(word)
-        if coef:
+        if coef is not None:
             ematrix[idx] = coef
 
     return eindex, ematrix
@@ -79,3 +82,187 @@ def lstm_simple(d_inp, d_out, inp_len, ematrix, lstm_units) -> Sequential:
         optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy']
     )
     return model
+
+
+class SparseDense(layers.Layer):
+    """Dense layer taking a `tf.SparseTensor`, computed without densifying.
+
+    Work and memory scale with the number of nonzeros in a batch rather than
+    batch size x vocabulary size, which is what makes 1-3-gram count/TF-IDF
+    inputs with hundreds of thousands of columns trainable.
+    """
+
+    def __init__(self, units: int, activation=None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.units = units
+        self.activation = tf.keras.activations.get(activation)
+
+    def build(self, input_shape) -> None:
+        self.kernel = self.add_weight(
+            name='kernel',
+            shape=(int(input_shape[-1]), self.units),
+            initializer='glorot_uniform'
+        )
+        self.bias = self.add_weight(
+            name='bias', shape=(self.units, ), initializer='zeros'
+        )
+
+    def call(self, inputs):
+        if isinstance(inputs, tf.SparseTensor):
+            out = tf.sparse.sparse_dense_matmul(inputs, self.kernel)
+        else:
+            out = tf.matmul(inputs, self.kernel)
+        return self.activation(out + self.bias)
+
+    def get_config(self) -> dict:
+        return {
+            **super().get_config(),
+            'units': self.units,
+            'activation': tf.keras.activations.serialize(self.activation),
+        }
+
+
+def counts_sequential(
+    n_features: int,
+    n_labels: int = 10,
+    units: Sequence[int] = (1000, 500, 100),
+    learning_rate: float = .0001,
+    sparse: bool = True,
+    name: str = 'sequential_counts'
+) -> Sequential:
+    """The `sequential_counts` architecture from analysis.ipynb.
+
+    With `sparse=True` the input is a `tf.SparseTensor` (see `fit_sparse`)
+    and the first layer is a `SparseDense`.
+    """
+    model = Sequential(name=name)
+    model.add(layers.InputLayer(input_shape=(n_features, ), sparse=sparse))
+    model.add(SparseDense(units[0]) if sparse else Dense(units[0]))
+    model.add(BatchNormalization())
+    model.add(layers.LeakyReLU())
+    for u in units[1:]:
+        model.add(Dense(u))
+        model.add(BatchNormalization())
+        model.add(layers.LeakyReLU())
+    # The output layer already applies the sigmoid; the notebook's
+    # from_logits=True applied it twice.
+    model.add(Dense(n_labels, activation='sigmoid'))
+    model.compile(
+        loss=BinaryCrossentropy(from_logits=False),
+        optimizer=Nadam(learning_rate=learning_rate),
+        metrics=['accuracy']
+    )
+    return model
+
+
+def tokenized_sequential(
+    vocab_size: int,
+    maxlen: int,
+    n_labels: int = 10,
+    embedding_dim: int = 200,
+    conv_filters: int = 0,
+    units: int = 250,
+    learning_rate: float = .001,
+    name: str = 'sequential_tokenized'
+) -> Sequential:
+    """The `sequential_tokenized` architecture from analysis.ipynb.
+
+    With `conv_filters` > 0 this is `sequential_tokenized_conv` instead: a
+    width-3 convolution ahead of the pooling and no hidden dense layer.
+    """
+    model = Sequential(name=name)
+    model.add(Embedding(vocab_size, embedding_dim, input_length=maxlen))
+    if conv_filters:
+        model.add(layers.Conv1D(conv_filters, 3, padding='valid'))
+        model.add(BatchNormalization())
+        model.add(layers.LeakyReLU())
+    model.add(layers.GlobalMaxPooling1D())
+    if not conv_filters:
+        model.add(Dense(units))
+        model.add(BatchNormalization())
+        model.add(layers.LeakyReLU())
+    model.add(Dense(n_labels, activation='sigmoid'))
+    model.compile(
+        loss=BinaryCrossentropy(from_logits=False),
+        optimizer=Nadam(learning_rate=learning_rate),
+        metrics=['accuracy']
+    )
+    return model
+
+
+def csr_to_sparse_tensor(X: csr_matrix) -> tf.SparseTensor:
+    coo = X.tocoo()
+    return tf.SparseTensor(
+        indices=np.stack([coo.row, coo.col], axis=1).astype(np.int64),
+        values=coo.data.astype(np.float32),
+        dense_shape=coo.shape
+    )
+
+
+def sparse_batches(
+    X: csr_matrix,
+    y: np.ndarray,
+    batch_size: int = 32,
+    shuffle: bool = True,
+    seed: Optional[int] = None
+) -> tf.data.Dataset:
+    """Streams row batches of a CSR matrix as `tf.SparseTensor`s.
+
+    Only one batch is ever converted at a time, so memory stays proportional
+    to the nonzeros of `X` (plus one batch) instead of its dense size.
+    """
+    X = csr_matrix(X)
+    X.sort_indices()
+    y = np.asarray(y, dtype=np.float32)
+    n_rows, n_cols = X.shape
+    rng = np.random.default_rng(seed)
+
+    def gen() -> Generator[Tuple[tf.SparseTensor, np.ndarray], None, None]:
+        order = rng.permutation(n_rows) if shuffle else np.arange(n_rows)
+        for start in range(0, n_rows, batch_size):
+            rows = np.sort(order[start:start + batch_size])
+            yield csr_to_sparse_tensor(X[rows]), y[rows]
+
+    return tf.data.Dataset.from_generator(
+        gen,
+        output_signature=(
+            tf.SparseTensorSpec(shape=(None, n_cols), dtype=tf.float32),
+            tf.TensorSpec(shape=(None, y.shape[1]), dtype=tf.float32),
+        )
+    ).prefetch(2)
+
+
+def fit_sparse(
+    model,
+    X_train: csr_matrix,
+    y_train: np.ndarray,
+    validation_data: Optional[Tuple[csr_matrix, np.ndarray]] = None,
+    batch_size: int = 32,
+    epochs: int = 50,
+    **kwargs
+):
+    """`model.fit` for CSR inputs, without densifying or `sort_indices()` calls.
+
+    Extra keyword arguments (callbacks, verbose, ...) go to `model.fit`.
+    """
+    val = None
+    if validation_data is not None:
+        val = sparse_batches(*validation_data, batch_size=batch_size, shuffle=False)
+    return model.fit(
+        sparse_batches(X_train, y_train, batch_size=batch_size),
+        validation_data=val,
+        epochs=epochs,
+        **kwargs
+    )
+
+
+def predict_sparse(model, X: csr_matrix, batch_size: int = 256) -> np.ndarray:
+    X = csr_matrix(X)
+    if X.shape[0] == 0:
+        return np.zeros((0, model.output_shape[-1]), np.float32)
+    return np.concatenate(
+        [
+            model.predict_on_batch(csr_to_sparse_tensor(X[i:i + batch_size]))
+            for i in range(0, X.shape[0], batch_size)
+        ]
+    )
@@ -1,10 +1,8 @@
 from collections import Counter
-from typing import List, Literal, Union, overload
+from functools import lru_cache
+import itertools
+from typing import Any, Callable, Dict, Iterable, List, Literal, Set, Union, overload
 
-from bs4 import BeautifulSoup
-import nltk
-from nltk.corpus import stopwords, wordnet
-import numpy as np
 import pandas as pd
 import re
 import string
@@ -21,15 +19,63 @@ PAT_EMOJI: re.Pattern = re.compile(
     flags=re.UNICODE
 )
 PAT_URL: re.Pattern = re.compile(r'https?://\S+|www\.\S+')
-STOPWORDS = set(stopwords.words('english'))
 
-lemmatizer = nltk.stem.WordNetLemmatizer()
-stemmer = nltk.stem.PorterStemmer()
-wordnet_map = {
-    'N': wordnet.NOUN, 'V': wordnet.VERB, 'J': wordnet.ADJ, 'R': wordnet.ADV
+
+# NLTK takes seconds to import and its corpora are read from disk, so they
+# are loaded on first use; `STOPWORDS`, `lemmatizer`, `stemmer` and
+# `wordnet_map` are still module attributes through `__getattr__`.
+@lru_cache(maxsize=None)
+def english_stopwords() -> Set[str]:
+    from nltk.corpus import stopwords
+    return set(stopwords.words('english'))
+
+
+@lru_cache(maxsize=None)
+def _lemmatizer():
+    from nltk.stem import WordNetLemmatizer
+    return WordNetLemmatizer()
+
+
+@lru_cache(maxsize=None)
+def _stemmer():
+    from nltk.stem import PorterStemmer
+    return PorterStemmer()
+
+
+@lru_cache(maxsize=None)
+def pos_tagger():
+    """The perceptron tagger behind `nltk.pos_tag`, unpickled only once."""
+    from nltk.tag.perceptron import PerceptronTagger
+    return PerceptronTagger()
+
+
+@lru_cache(maxsize=2**18)
+def lemmatize_word(word: str, pos: str) -> str:
+    return _lemmatizer().lemmatize(word, pos)
+
+
+@lru_cache(maxsize=None)
+def _wordnet_map() -> Dict[str, str]:
+    from nltk.corpus import wordnet
+    return {
+        'N': wordnet.NOUN, 'V': wordnet.VERB, 'J': wordnet.ADJ, 'R': wordnet.ADV
+    }
+
+
+_LAZY: Dict[str, Callable[[], Any]] = {
+    'STOPWORDS': english_stopwords,
+    'lemmatizer': _lemmatizer,
+    'stemmer': _stemmer,
+    'wordnet_map': _wordnet_map,
 }
 
 
+def __getattr__(name: str) -> Any:
+    if name in _LAZY:
+        return _LAZY[name]()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 @overload
 def standardize_formatting(
     df: pd.Series,
@@ -52,7 +98,8 @@ def standardize_formatting(
     df: Union[pd.DataFrame, pd.Series],
     keep_urls: bool = False,
     keep_emoji: bool = False,
-    stemming: Literal['stem', 'lemmatize'] = None
+    stemming: Literal['stem', 'lemmatize'] = None,
+    n_jobs: int = 1
 ) -> Union[pd.DataFrame, pd.Series]:
     """Function for easily standardizing all text in a DataFrame or Series.
 
@@ -75,6 +122,9 @@ def standardize_formatting(
         If not None, will either stem or lemmatize words depending in on
         the passed in string identifier ('stem' for stemming and 'lemmatize'
         for lemmatizing). By default None.
+    n_jobs : int, optional
+        Worker processes used to POS-tag and lemmatize when
+        stemming='lemmatize' (see `tagging.TaggingEngine`), by default 1
 
     Returns
     -------
@@ -91,7 +141,7 @@ def standardize_formatting(
             if not keep_urls:
                 df[col] = df[col].apply(lambda t: remove_urls(t))
             if stemming:
-                df[col] = df[col].apply(lambda t: stem_words(t, stemming))
+                df[col] = _stem_series(df[col], stemming, n_jobs)
     # No columns for a series, so just apply to series directly
     else:
         df = df.apply(lambda t: remove_punctuation(t)).str.lower()
@@ -100,10 +150,20 @@ def standardize_formatting(
             df = df.apply(lambda t: remove_emoji(t))
         if not keep_urls:
             df = df.apply(lambda t: remove_urls(t))
+        if stemming:
+            df = _stem_series(df, stemming, n_jobs)
 
     return df
 
 
+def _stem_series(series: pd.Series, mode: str, n_jobs: int) -> pd.Series:
+    if mode == 'stem':
+        return series.apply(lambda t: stem_words(t, mode))
+    from .tagging import TaggingEngine
+    with TaggingEngine(n_jobs=n_jobs) as engine:
+        return pd.Series(engine.lemmatize(list(series)), index=series.index)
+
+
 def remove_words(
     df: Union[pd.DataFrame, pd.Series],
     stopwords: bool = False,
@@ -139,7 +199,8 @@ def remove_words(
                         counter[word] += 1
 
             if stopwords:
-                df[col] = df[col].apply(lambda t: remove_wordlist(t, STOPWORDS))
+                stops = english_stopwords()
+                df[col] = df[col].apply(lambda t: remove_wordlist(t, stops))
             if freqwords > 0:
                 top_words = set(
                     [w for (w, _) in counter.most_common(freqwords)]
@@ -159,7 +220,8 @@ def remove_words(
                     counter[word] += 1
 
         if stopwords:
-            df = df.apply(lambda t: remove_wordlist(t, STOPWORDS))
+            stops = english_stopwords()
+            df = df.apply(lambda t: remove_wordlist(t, stops))
         if freqwords > 0:
             top_words = set([w for (w, _) in counter.most_common(freqwords)])
             df = df.apply(lambda t: remove_wordlist(t, top_words))
@@ -172,14 +234,102 @@ def remove_words(
     return df
 
 
+def _standardize(texts: List[str], options: dict) -> pd.Series:
+    return standardize_formatting(
+        pd.Series(texts, dtype=str),
+        keep_urls=options.get('keep_urls', False),
+        keep_emoji=options.get('keep_emoji', False),
+        stemming=options.get('stemming'),
+    )
+
+
+def fit_word_lists(
+    texts: Iterable[str],
+    options: dict,
+    chunksize: int = 10000
+) -> dict:
+    """Fixes the `freqwords`/`rarewords` options to word lists from a corpus.
+
+    `remove_words` counts words in whatever frame it is given, so applied
+    batch by batch it would drop different words depending on which texts
+    share a batch. This counts them once over the training texts (streamed
+    in chunks, after `standardize_formatting` as in `preprocess_texts`) and
+    stores the lists in the returned options, which `preprocess_texts` then
+    applies to every text alike. The result is JSON-serializable, so it can
+    be bundled with the model.
+
+    Parameters
+    ----------
+    texts : Iterable[str]
+        The raw training texts.
+    options : dict
+        Options for `preprocess_texts`.
+    chunksize : int, optional
+        Texts standardized at a time, by default 10000
+
+    Returns
+    -------
+    dict
+        A copy of `options` with 'freqword_list' and 'rareword_list' set.
+    """
+    options = dict(options)
+    freqwords = options.get('freqwords', 0)
+    rarewords = options.get('rarewords', 0)
+    counter = Counter()
+    if freqwords > 0 or rarewords > 0:
+        it = iter(texts)
+        while chunk := list(itertools.islice(it, chunksize)):
+            for doc in _standardize(chunk, options):
+                counter.update(doc.split())
+    options['freqword_list'] = [w for (w, _) in counter.most_common(freqwords)]
+    options['rareword_list'] = [
+        w for (w, _) in counter.most_common()[:-rarewords - 1:-1]
+    ] if rarewords > 0 else []
+    return options
+
+
+def check_options(options: dict) -> None:
+    """Raises ValueError if `freqwords`/`rarewords` lack fitted word lists."""
+    for n, key in (('freqwords', 'freqword_list'), ('rarewords', 'rareword_list')):
+        if options.get(n, 0) > 0 and key not in options:
+            raise ValueError(
+                f'{n} needs a fitted word list; pass the options through fit_word_lists first.'
+            )
+
+
+def preprocess_texts(texts: List[str], options: dict) -> List[str]:
+    """Applies a dict of preprocessing options to a batch of texts.
+
+    `options` holds keyword arguments for `standardize_formatting`
+    (keep_urls, keep_emoji, stemming) and `remove_words` (stopwords,
+    freqwords, rarewords). An empty dict leaves the texts untouched. Every
+    text is processed on its own, so the output doesn't depend on the
+    batch; `freqwords`/`rarewords` therefore need the word lists from
+    `fit_word_lists`.
+    """
+    if not options:
+        return list(texts)
+    check_options(options)
+    series = _standardize(texts, options)
+    if options.get('stopwords', False):
+        stops = english_stopwords()
+        series = series.apply(lambda t: remove_wordlist(t, stops))
+    drop = set(options.get('freqword_list', ())) | set(options.get('rareword_list', ()))
+    if drop:
+        series = series.apply(lambda t: remove_wordlist(t, drop))
+    return list(series)
+
+
 def stem_words(text: str, mode: Literal['stem', 'lemmatize']) -> str:
     if mode == 'stem':
+        stemmer = _stemmer()
         return " ".join([stemmer.stem(w) for w in text.split()])
     else:
-        tagged = nltk.pos_tag(text.split())
+        wordnet_map = _wordnet_map()
+        tagged = pos_tagger().tag(text.split())
         return " ".join(
             [
-                lemmatizer.lemmatize(w, wordnet_map.get(pos[0], wordnet.NOUN))
+                lemmatize_word(w, wordnet_map.get(pos[0], wordnet_map['N']))
                 for w,
                 pos in tagged
             ]
@@ -193,6 +343,7 @@ def remove_emoji(text: str) -> str:
 
 def remove_html(text: str) -> str:
     """Removes all HTML tags from a body of text."""
+    from bs4 import BeautifulSoup
     return BeautifulSoup(text, 'lxml').text
 
 
@@ -212,4 +363,5 @@ def remove_wordlist(text: str, wordlist: List[str]) -> str:
 
 
 def tokenization(text: str) -> List[str]:
+    import nltk
     return [word for word in nltk.word_tokenize(text) if word.isalpha()]
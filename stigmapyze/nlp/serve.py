@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import pickle
+from time import perf_counter
+from typing import Any, Callable, Dict, Final, List, Optional, Tuple
+
+import numpy as np
+
+from .bundle import Bundle
+from .corpus import LABELS
+from .preprocessing import check_options, preprocess_texts
+from ..scraping.metrics import REGISTRY
+
+MAX_BATCH: Final[int] = 256
+MAX_DELAY: Final[float] = .01
+# Longest request line in bytes; asyncio's default of 64 KiB is a handful of
+# full-length selftexts.
+MAX_LINE: Final[int] = 2**24
+
+
+class Scorer:
+    """A trained model together with everything needed to feed it raw text.
+
+    Attributes:
+        model: A compiled Keras model with one sigmoid output per label.
+        featurize (Callable): Maps a list of preprocessed texts to model input.
+        labels (List[str]): Label names in model output order.
+        preprocess (dict): Options for `preprocessing.preprocess_texts`.
+            Empty means texts are used as-is, which is how the models in
+            analysis.ipynb were trained. Frequent/rare word removal uses the
+            lists fitted at training time, so a text scores the same
+            whatever it is batched with.
+    """
+
+    def __init__(
+        self,
+        model,
+        featurize: Callable[[List[str]], Any],
+        labels: List[str] = LABELS,
+        preprocess: Optional[dict] = None
+    ) -> None:
+        self.model = model
+        self.featurize = featurize
+        self.labels = list(labels)
+        self.preprocess = preprocess or {}
+        check_options(self.preprocess)
+
+    @classmethod
+    def load(
+        cls,
+        model_path: str,
+        vectorizer_path: Optional[str] = None,
+        tokenizer_path: Optional[str] = None,
+        maxlen: Optional[int] = None,
+        labels: List[str] = LABELS,
+        preprocess: Optional[dict] = None
+    ) -> 'Scorer':
+        """Loads a saved Keras model with its vectorizer or tokenizer.
+
+        Args:
+            model_path (str): Path given to `model.save`.
+            vectorizer_path (str, optional): Pickled, fitted sklearn
+                CountVectorizer/TfidfVectorizer.
+            tokenizer_path (str, optional): Output of `Tokenizer.to_json()`;
+                sequences are post-padded to `maxlen` as in analysis.ipynb.
+            maxlen (int, optional): Sequence length for tokenized models.
+            labels (List[str], optional): Label names in output order.
+            preprocess (dict, optional): See `Scorer.preprocess`.
+        """
+        from keras.models import load_model
+        from keras.preprocessing import text
+
+        if vectorizer_path:
+            with open(vectorizer_path, 'rb') as f:
+                featurize = vectorizer_featurizer(pickle.load(f))
+        elif tokenizer_path:
+            with open(tokenizer_path, 'r') as f:
+                tokenizer = text.tokenizer_from_json(f.read())
+            featurize = tokenizer_featurizer(tokenizer, maxlen)
+        else:
+            raise ValueError('One of vectorizer_path or tokenizer_path is required.')
+
+        return cls(load_model(model_path), featurize, labels, preprocess)
+
+    @classmethod
+    def from_bundle(cls, path: str) -> 'Scorer':
+        """Builds a scorer from a directory written by `export_bundle`."""
+        bundle = Bundle.load(path)
+        return cls(bundle.model, bundle.featurize, bundle.labels, bundle.preprocess)
+
+    def clean(self, texts: List[str]) -> List[str]:
+        return preprocess_texts(texts, self.preprocess)
+
+    def predict(self, texts: List[str]) -> np.ndarray:
+        """Per-label probabilities, shape (len(texts), len(labels))."""
+        X = self.featurize(self.clean(texts))
+        return np.asarray(self.model.predict(X, batch_size=len(texts)))
+
+    def score(self, texts: List[str]) -> List[Dict[str, float]]:
+        return [
+            dict(zip(self.labels, map(float, row)))
+            for row in self.predict(texts)
+        ]
+
+
+def vectorizer_featurizer(vectorizer) -> Callable[[List[str]], Any]:
+    def featurize(texts: List[str]):
+        X = vectorizer.transform(texts)
+        X.sort_indices()
+        return X
+
+    return featurize
+
+
+def tokenizer_featurizer(tokenizer, maxlen: int) -> Callable[[List[str]], Any]:
+    from keras.preprocessing import sequence
+
+    def featurize(texts: List[str]):
+        return sequence.pad_sequences(
+            tokenizer.texts_to_sequences(texts), maxlen=maxlen, padding='post'
+        )
+
+    return featurize
+
+
+class BatchingServer:
+    """Asyncio server scoring texts in micro-batches.
+
+    Clients send newline-delimited JSON requests such as
+    ``{"id": 1, "texts": ["..."]}`` and receive ``{"id": 1, "scores": [...]}``
+    with one ``{label: probability}`` object per text. Texts from all
+    connections share one queue; a batch is scored as soon as it holds
+    `max_batch` texts or `max_delay` seconds have passed since its first text
+    arrived, whichever comes first. A request line longer than `max_line`
+    bytes gets an ``{"error": ...}`` reply and is skipped.
+    """
+
+    def __init__(
+        self,
+        scorer: Scorer,
+        max_batch: int = MAX_BATCH,
+        max_delay: float = MAX_DELAY,
+        max_line: int = MAX_LINE
+    ) -> None:
+        self.scorer = scorer
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_line = max_line
+        self._queue: Optional[asyncio.Queue] = None
+        self._arrived: Optional[asyncio.Event] = None
+        # Keras predict releases the GIL; one thread keeps batches in order.
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def score(self, texts: List[str]) -> List[Dict[str, float]]:
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in texts]
+        for t, fut in zip(texts, futures):
+            await self._queue.put((t, fut))
+        self._arrived.set()
+        REGISTRY.gauge('queue_depth', queue='inference').set(self._queue.qsize())
+        return list(await asyncio.gather(*futures))
+
+    async def _next_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            # Waiting on the event rather than on `queue.get()` means a
+            # timeout can't cancel a get that already took a request.
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        REGISTRY.gauge('queue_depth', queue='inference').set(self._queue.qsize())
+        return batch
+
+    async def _batcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            texts = [t for t, _ in batch]
+            start = perf_counter()
+            try:
+                scores = await loop.run_in_executor(
+                    self._executor, self.scorer.score, texts
+                )
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            REGISTRY.histogram('inference_batch_seconds').observe(
+                perf_counter() - start
+            )
+            REGISTRY.records('inference', len(batch))
+            for (_, fut), s in zip(batch, scores):
+                if not fut.done():
+                    fut.set_result(s)
+
+    async def _handle(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while (line := await _read_line(reader)) != b'':
+                try:
+                    if line is None:
+                        raise ValueError(f'request longer than {self.max_line} bytes')
+                    req = json.loads(line)
+                    resp = {
+                        'id': req.get('id'),
+                        'scores': await self.score(list(req['texts'])),
+                    }
+                except Exception as e:
+                    resp = {'error': f'{type(e).__name__}: {e}'}
+                writer.write(json.dumps(resp).encode('utf-8') + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 8765,
+        path: Optional[str] = None
+    ) -> None:
+        """Serves forever on `path` (a Unix socket) if given, else host:port."""
+        self._queue = asyncio.Queue()
+        self._arrived = asyncio.Event()
+        batcher = asyncio.create_task(self._batcher())
+        if path:
+            server = await asyncio.start_unix_server(
+                self._handle, path=path, limit=self.max_line
+            )
+        else:
+            server = await asyncio.start_server(
+                self._handle, host, port, limit=self.max_line
+            )
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+async def _read_line(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """The next line, b'' at EOF, or None for a line over the reader's limit.
+
+    Unlike `StreamReader.readline`, an over-long line is read to its end and
+    dropped, so the connection stays usable for the next request.
+    """
+    too_long = False
+    while True:
+        try:
+            line = await reader.readuntil(b'\n')
+        except asyncio.IncompleteReadError as e:
+            line = e.partial
+        except asyncio.LimitOverrunError as e:
+            too_long = True
+            await reader.readexactly(e.consumed)
+            continue
+        return None if too_long else line
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description='Serve stigma/challenge label probabilities for raw text.'
+    )
+    parser.add_argument('model', nargs='?', help='saved Keras model')
+    feat = parser.add_mutually_exclusive_group(required=True)
+    feat.add_argument('--bundle', help='directory written by export_bundle')
+    feat.add_argument('--vectorizer', help='pickled fitted sklearn vectorizer')
+    feat.add_argument('--tokenizer', help='Keras Tokenizer.to_json() output')
+    parser.add_argument('--maxlen', type=int, help='padded sequence length')
+    parser.add_argument('--socket', help='Unix socket path (overrides host/port)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    parser.add_argument('--max-delay', type=float, default=MAX_DELAY)
+    parser.add_argument(
+        '--max-line', type=int, default=MAX_LINE, help='longest request in bytes'
+    )
+    args = parser.parse_args(argv)
+
+    if args.bundle:
+        scorer = Scorer.from_bundle(args.bundle)
+    elif args.model:
+        scorer = Scorer.load(
+            args.model,
+            vectorizer_path=args.vectorizer,
+            tokenizer_path=args.tokenizer,
+            maxlen=args.maxlen
+        )
+    else:
+        parser.error('a model path is required unless --bundle is given')
+    server = BatchingServer(scorer, args.max_batch, args.max_delay, args.max_line)
+    asyncio.run(server.serve(args.host, args.port, args.socket))
+
+
+if __name__ == '__main__':
+    main()
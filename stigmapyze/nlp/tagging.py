@@ -0,0 +1,173 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from typing import Dict, Final, List, Literal, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .preprocessing import pos_tagger, stem_words, tokenization
+
+CHUNKSIZE: Final[int] = 256
+CACHE_SIZE: Final[int] = 100000
+# Penn Treebank tags emitted by NLTK's perceptron tagger. Tags travel back
+# from workers as uint8 indices into this list.
+TAGS: Final[List[str]] = [
+    'CC', 'CD', 'DT', 'EX', 'FW', 'IN', 'JJ', 'JJR', 'JJS', 'LS', 'MD', 'NN',
+    'NNS', 'NNP', 'NNPS', 'PDT', 'POS', 'PRP', 'PRP$', 'RB', 'RBR', 'RBS',
+    'RP', 'SYM', 'TO', 'UH', 'VB', 'VBD', 'VBG', 'VBN', 'VBP', 'VBZ', 'WDT',
+    'WP', 'WP$', 'WRB', '$', "''", '``', '(', ')', ',', '--', '.', ':', '#',
+    '-NONE-',
+]
+TAG_IDS: Final[Dict[str, int]] = {t: i for i, t in enumerate(TAGS)}
+# Tokens never contain whitespace, so a control character can join them.
+SEP: Final[str] = '\x1f'
+
+Op = Literal['tokenize', 'tag', 'lemmatize']
+
+
+def _pack(tokens: List[List[str]]) -> Tuple[str, np.ndarray]:
+    offsets = np.cumsum([0] + [len(t) for t in tokens], dtype=np.int64)
+    return SEP.join(w for doc in tokens for w in doc), offsets
+
+
+def _unpack(joined: str, offsets: np.ndarray) -> List[List[str]]:
+    flat = joined.split(SEP) if offsets[-1] else []
+    return [flat[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def _run(op: str, texts: Sequence[str]) -> tuple:
+    # Runs in the worker. NLTK models are cached per process by the
+    # `preprocessing` loaders, so each worker loads them once.
+    if op == 'lemmatize':
+        return ([stem_words(t, 'lemmatize') for t in texts], )
+    if op == 'tokenize':
+        return _pack([tokenization(t) for t in texts])
+
+    tagger = pos_tagger()
+    tagged = [tagger.tag(t.split()) for t in texts]
+    joined, offsets = _pack([[w for w, _ in doc] for doc in tagged])
+    tags = np.fromiter(
+        (TAG_IDS.get(tag, TAG_IDS['NN']) for doc in tagged for _, tag in doc),
+        dtype=np.uint8
+    )
+    return joined, offsets, tags
+
+
+def _decode(op: str, packed: tuple) -> list:
+    if op == 'lemmatize':
+        return packed[0]
+    if op == 'tokenize':
+        return [tuple(doc) for doc in _unpack(*packed)]
+
+    joined, offsets, tags = packed
+    docs = _unpack(joined, offsets)
+    return [
+        tuple(zip(doc, (TAGS[t] for t in tags[offsets[i]:offsets[i + 1]])))
+        for i, doc in enumerate(docs)
+    ]
+
+
+class TaggingEngine:
+    """Batched NLTK tokenization, POS tagging and lemmatization.
+
+    Documents are deduplicated and looked up in an LRU cache keyed by a hash
+    of their text (crossposts and pasted hotline replies repeat a lot), and
+    the rest are spread in chunks over a pool of worker processes that load
+    the tokenizer, tagger and WordNet once and live as long as the engine.
+    Workers return each chunk as one joined string of tokens, their offsets
+    and uint8 tag ids rather than lists of tuples, which keeps pickling
+    cheap. With `n_jobs=1` everything runs in-process.
+
+    Results equal the per-document functions in `preprocessing`:
+    `tokenize` matches `tokenization`, `pos_tag` matches `nltk.pos_tag` on
+    whitespace-split text, and `lemmatize` matches `stem_words(t,
+    'lemmatize')`. Returned sequences are cached and shared, so don't mutate
+    them.
+
+    Attributes:
+        n_jobs (int): Worker processes.
+        chunksize (int): Documents per worker task.
+        cache_size (int): Results kept per operation; 0 disables the cache.
+        hits (int): Documents answered from the cache or a duplicate.
+        misses (int): Documents processed.
+    """
+
+    def __init__(
+        self,
+        n_jobs: int = 1,
+        chunksize: int = CHUNKSIZE,
+        cache_size: int = CACHE_SIZE
+    ) -> None:
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache: 'OrderedDict[bytes, object]' = OrderedDict()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> 'TaggingEngine':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def tokenize(self, texts: Sequence[str]) -> List[Tuple[str, ...]]:
+        """Alphabetic `nltk.word_tokenize` tokens of each text."""
+        return self._map('tokenize', texts)
+
+    def pos_tag(self, texts: Sequence[str]) -> List[Tuple[Tuple[str, str], ...]]:
+        """(token, Penn Treebank tag) pairs of each whitespace-split text."""
+        return self._map('tag', texts)
+
+    def lemmatize(self, texts: Sequence[str]) -> List[str]:
+        """POS-aware WordNet lemmatization of each text."""
+        return self._map('lemmatize', texts)
+
+    def _map(self, op: Op, texts: Sequence[str]) -> list:
+        results: list = [None] * len(texts)
+        todo: Dict[bytes, List[int]] = {}
+        for i, text in enumerate(texts):
+            key = blake2b(
+                text.encode('utf-8', 'surrogatepass'), digest_size=16, person=op.encode()
+            ).digest()
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                results[i] = self._cache[key]
+                self.hits += 1
+            elif key in todo:
+                todo[key].append(i)
+                self.hits += 1
+            else:
+                todo[key] = [i]
+                self.misses += 1
+
+        unique = [texts[idx[0]] for idx in todo.values()]
+        for (key, idx), value in zip(todo.items(), self._compute(op, unique)):
+            for i in idx:
+                results[i] = value
+            if self.cache_size:
+                self._cache[key] = value
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return results
+
+    def _compute(self, op: Op, texts: List[str]) -> list:
+        if self.n_jobs == 1 or len(texts) <= self.chunksize:
+            return _decode(op, _run(op, texts))
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.n_jobs)
+        chunks = [
+            texts[i:i + self.chunksize]
+            for i in range(0, len(texts), self.chunksize)
+        ]
+        out: list = []
+        for packed in self._pool.map(_run, [op] * len(chunks), chunks):
+            out.extend(_decode(op, packed))
+        return out
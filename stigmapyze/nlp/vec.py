@@ -1,16 +1,67 @@
-from nltk import word_tokenize
-from nltk.corpus import stopwords
+from typing import Dict, Final, Iterable, List, Optional, Tuple
+
+import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
 
-STOPWORDS = set(stopwords.words('english'))
+from .preprocessing import english_stopwords
+
+GLOVE_DIM: Final[int] = 300
+
+
+def load_glove(
+    glove_txt: str,
+    vocab: Optional[Iterable[str]] = None,
+    dim: int = GLOVE_DIM
+) -> Tuple[Dict[str, int], np.ndarray]:
+    """Reads GloVe vectors into one contiguous float32 matrix.
+
+    Args:
+        glove_txt (str): Path to a GloVe text file, e.g. `neural.GLOVE_TXT`.
+        vocab (Iterable[str], optional): Only keep these words, which keeps
+            the 2M-word 840B vectors from filling memory.
+        dim (int, optional): Vector size.
 
+    Returns:
+        Tuple[Dict[str, int], np.ndarray]: Row of each word, and the
+            (n_words, dim) matrix.
+    """
+    keep = set(vocab) if vocab is not None else None
+    words: Dict[str, int] = {}
+    rows: List[np.ndarray] = []
+    with open(glove_txt, 'r', encoding='utf-8') as glove:
+        for line in glove:
+            # Some 840B "words" contain spaces, so split from the right.
+            parts = line.rstrip('\n').rsplit(' ', dim)
+            word = parts[0]
+            if (keep is not None and word not in keep) or word in words:
+                continue
+            words[word] = len(rows)
+            rows.append(np.asarray(parts[1:], dtype=np.float32))
+    matrix = np.vstack(rows) if rows else np.zeros((0, dim), dtype=np.float32)
+    return words, matrix
 
-def sentence_vec_normed(text: str):
-    words = [
-        word for word in word_tokenize(str(text).lower().decode('utf-8'))
-        if not word in STOPWORDS and word.isalpha()
+
+def sentence_vec_normed(text: str, words: Dict[str, int], matrix: np.ndarray) -> np.ndarray:
+    """Unit-length mean GloVe vector of a text's non-stopword words.
+
+    Texts with no known word map to the zero vector.
+    """
+    from nltk import word_tokenize
+
+    stopwords = english_stopwords()
+    rows = [
+        words[word] for word in word_tokenize(str(text).lower())
+        if word not in stopwords and word.isalpha() and word in words
     ]
+    if not rows:
+        return np.zeros(matrix.shape[1], dtype=np.float32)
+    v = matrix[rows].sum(axis=0)
+    return v / np.sqrt((v**2).sum())
+
 
-    embedded = []
-    for word in words:
-        continue
+def sentence_vecs(texts: Iterable[str], words: Dict[str, int], matrix: np.ndarray) -> np.ndarray:
+    """`sentence_vec_normed` for each text, stacked into a float32 matrix."""
+    return np.vstack(
+        [sentence_vec_normed(t, words, matrix) for t in texts]
+        or [np.zeros((0, matrix.shape[1]), dtype=np.float32)]
+    ).astype(np.float32)
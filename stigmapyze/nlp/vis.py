@@ -1,10 +1,11 @@
-from typing import Tuple
-from matplotlib.axes import Axes
-from matplotlib.figure import Figure
-import matplotlib.pyplot as plt
-import seaborn as sns
+from typing import TYPE_CHECKING, Tuple
+
 from sklearn.feature_extraction.text import CountVectorizer
 
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+    from matplotlib.figure import Figure
+
 
 def get_ngrams(text, n: int, amount: int):
     counter = CountVectorizer(ngram_range=(n, n)).fit(text)
@@ -13,7 +14,10 @@ def get_ngrams(text, n: int, amount: int):
     return sorted(freqs, key=lambda t: t[1], reverse=True)[:amount]
 
 
-def plot_ngrams(text, n: int, amount: int) -> Tuple[Figure, Axes, list]:
+def plot_ngrams(text, n: int, amount: int) -> Tuple['Figure', 'Axes', list]:
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     fig, ax = plt.subplots(figsize=(16, 10))
     ngrams = get_ngrams(text, 1, amount)
     ax = sns.barplot(
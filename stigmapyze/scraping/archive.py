@@ -0,0 +1,238 @@
+from bisect import bisect_left, bisect_right
+import gzip
+import os
+import threading
+from typing import Callable, Dict, Final, Generator, Iterable, List, Literal, Optional, Tuple, TypeVar, Union
+
+from .decoding import iter_data
+from ..common.reddit import RedditContent
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_BYTES: Final[int] = 64 * 2**20
+# Records `replay` fetches together, decompressing each page once per window.
+REPLAY_WINDOW: Final[int] = 10000
+
+Kind = Literal['submissions', 'comments']
+R = TypeVar('R', bound=RedditContent)
+
+
+class _IndexEntry:
+    __slots__ = ('chunk', 'offset', 'length', 'pos', 'created_utc')
+
+    def __init__(self, chunk: str, offset: int, length: int, pos: int, created_utc: int) -> None:
+        self.chunk = chunk
+        self.offset = offset
+        self.length = length
+        self.pos = pos
+        self.created_utc = created_utc
+
+
+class RawArchive:
+    """Append-only store of raw Pushshift pages with random access by ID.
+
+    Each page body is compressed as its own zstd frame (or gzip member, if
+    `zstandard` isn't installed) and appended to a chunk file; a sidecar
+    `.idx` file per chunk records the ID, created_utc, frame offset/length
+    and position in the page of every record. Fetching a record decompresses
+    only the one page holding it, so adding a field later is a local replay
+    of the archive instead of a re-scrape.
+
+    Layout::
+
+        <path>/submissions/chunk-00000.zst
+        <path>/submissions/chunk-00000.idx
+        <path>/comments/...
+
+    Attributes:
+        path (str): Archive root.
+        codec (str): 'zstd' or 'gzip', for newly written chunks.
+        chunk_bytes (int): Size at which a new chunk file is started.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        codec: Optional[Literal['zstd', 'gzip']] = None,
+        chunk_bytes: int = CHUNK_BYTES
+    ) -> None:
+        self.path = path
+        self.codec = codec or ('zstd' if zstandard else 'gzip')
+        if self.codec == 'zstd' and zstandard is None:
+            raise ImportError('zstd archives need the zstandard package.')
+        self.chunk_bytes = chunk_bytes
+        self._writers: Dict[str, Tuple[str, object, object]] = {}
+        self._index: Dict[str, Dict[str, _IndexEntry]] = {}
+        self._by_time: Dict[str, List[Tuple[int, str]]] = {}
+        self._lock = threading.Lock()
+
+    def _compress(self, body: bytes) -> bytes:
+        if self.codec == 'zstd':
+            return zstandard.ZstdCompressor().compress(body)
+        return gzip.compress(body)
+
+    def _writer(self, kind: str):
+        chunk, data, idx = self._writers.get(kind, (None, None, None))
+        if data is not None and data.tell() < self.chunk_bytes:
+            return chunk, data, idx
+        if data is not None:
+            data.close()
+            idx.close()
+
+        folder = os.path.join(self.path, kind)
+        os.makedirs(folder, exist_ok=True)
+        ext = 'zst' if self.codec == 'zstd' else 'gz'
+        n = sum(1 for f in os.listdir(folder) if f.endswith('.idx'))
+        chunk = f'chunk-{n:05d}.{ext}'
+        data = open(os.path.join(folder, chunk), 'ab')
+        idx = open(os.path.join(folder, f'chunk-{n:05d}.idx'), 'a')
+        self._writers[kind] = (chunk, data, idx)
+        return chunk, data, idx
+
+    def write_page(self, kind: Kind, body: Union[bytes, str]) -> int:
+        """Appends a raw response page; returns the number of records indexed."""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        records = list(iter_data(body))
+        if not records:
+            return 0
+
+        frame = self._compress(body)
+        # Pages may arrive from several fetch threads at once.
+        with self._lock:
+            chunk, data, idx = self._writer(kind)
+            offset = data.tell()
+            data.write(frame)
+            data.flush()
+            lines = [
+                f'{r["id"]}\t{int(r.get("created_utc") or 0)}\t{offset}\t{len(frame)}\t{pos}\n'
+                for pos, r in enumerate(records)
+            ]
+            idx.writelines(lines)
+            idx.flush()
+
+            if kind in self._index:
+                for pos, r in enumerate(records):
+                    self._add_entry(kind, r['id'], _IndexEntry(
+                        chunk, offset, len(frame), pos, int(r.get('created_utc') or 0)
+                    ))
+        return len(records)
+
+    def close(self) -> None:
+        for _, data, idx in self._writers.values():
+            data.close()
+            idx.close()
+        self._writers.clear()
+
+    def __enter__(self) -> 'RawArchive':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _add_entry(self, kind: str, id: str, entry: _IndexEntry) -> None:
+        # Later pages win, matching what a re-scrape would return.
+        self._index[kind][id] = entry
+        self._by_time.pop(kind, None)
+
+    def index(self, kind: Kind) -> Dict[str, _IndexEntry]:
+        """ID -> location of every archived record of `kind` (loaded once)."""
+        if kind not in self._index:
+            self._index[kind] = {}
+            folder = os.path.join(self.path, kind)
+            if os.path.isdir(folder):
+                for f in sorted(os.listdir(folder)):
+                    if not f.endswith('.idx'):
+                        continue
+                    stem = f[:-len('.idx')]
+                    chunk = next(c for c in os.listdir(folder)
+                                 if c.startswith(stem) and not c.endswith('.idx'))
+                    with open(os.path.join(folder, f), 'r') as fp:
+                        for line in fp:
+                            id, created, offset, length, pos = line.rstrip('\n').split('\t')
+                            self._add_entry(kind, id, _IndexEntry(
+                                chunk, int(offset), int(length), int(pos), int(created)
+                            ))
+        return self._index[kind]
+
+    def _page(self, kind: str, chunk: str, offset: int, length: int) -> List[dict]:
+        with open(os.path.join(self.path, kind, chunk), 'rb') as fp:
+            fp.seek(offset)
+            frame = fp.read(length)
+        if chunk.endswith('.zst'):
+            body = zstandard.ZstdDecompressor().decompress(frame)
+        else:
+            body = gzip.decompress(frame)
+        return list(iter_data(body))
+
+    def get(self, kind: Kind, id: str) -> Optional[dict]:
+        entry = self.index(kind).get(id)
+        if entry is None:
+            return None
+        return self._page(kind, entry.chunk, entry.offset, entry.length)[entry.pos]
+
+    def get_many(self, kind: Kind, ids: Iterable[str]) -> Dict[str, dict]:
+        """Fetches several records, decompressing each page at most once."""
+        index = self.index(kind)
+        pages: Dict[Tuple[str, int, int], List[Tuple[str, int]]] = {}
+        for id in ids:
+            e = index.get(id)
+            if e is not None:
+                pages.setdefault((e.chunk, e.offset, e.length), []).append((id, e.pos))
+        out = {}
+        for (chunk, offset, length), wanted in sorted(pages.items()):
+            page = self._page(kind, chunk, offset, length)
+            for id, pos in wanted:
+                out[id] = page[pos]
+        return out
+
+    def ids_between(
+        self,
+        kind: Kind,
+        after: Optional[int] = None,
+        before: Optional[int] = None
+    ) -> List[str]:
+        """IDs with `after` < created_utc < `before`, oldest first."""
+        index = self.index(kind)
+        if kind not in self._by_time:
+            self._by_time[kind] = sorted((e.created_utc, id) for id, e in index.items())
+        by_time = self._by_time[kind]
+        lo = bisect_right(by_time, (after, '\uffff')) if after is not None else 0
+        hi = bisect_left(by_time, (before, '')) if before is not None else len(by_time)
+        return [id for _, id in by_time[lo:hi]]
+
+    def replay(
+        self,
+        kind: Kind,
+        fields: Optional[List[str]] = None,
+        after: Optional[int] = None,
+        before: Optional[int] = None,
+        factory: Optional[Callable[[dict], R]] = None,
+        window: int = REPLAY_WINDOW
+    ) -> Generator[Union[dict, R], None, None]:
+        """Re-projects archived records, oldest first.
+
+        Pages don't follow time order (comment pages are per submission, so
+        their times interleave), so records are fetched `window` at a time
+        with `get_many`, which decompresses each page they touch once.
+
+        Args:
+            kind (str): 'submissions' or 'comments'.
+            fields (List[str], optional): Keep only these raw fields.
+            after, before (int, optional): created_utc bounds.
+            factory (Callable, optional): Builds a record from each raw
+                dict, e.g. `Submission`; by default raw dicts are yielded.
+            window (int, optional): Records held in memory at a time.
+        """
+        ids = self.ids_between(kind, after, before)
+        for start in range(0, len(ids), window):
+            batch = ids[start:start + window]
+            records = self.get_many(kind, batch)
+            for id in batch:
+                raw = records[id]
+                if fields is not None:
+                    raw = {f: raw.get(f) for f in fields}
+                yield factory(raw) if factory else raw
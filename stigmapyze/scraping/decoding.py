@@ -0,0 +1,60 @@
+import json
+from typing import Callable, Dict, Final, Generator, List, Type, TypeVar, Union
+
+from ..common.reddit import Comment, RedditContent, Submission
+
+# A C parser over the whole page beats anything done element-wise in Python,
+# so use one when installed, else the stdlib's.
+try:
+    import orjson as _fastjson
+except ImportError:
+    try:
+        import ujson as _fastjson
+    except ImportError:
+        _fastjson = None
+
+BACKEND: Final[str] = _fastjson.__name__ if _fastjson else 'json'
+
+# Fields that exist on our records but are not Pushshift fields.
+LOCAL_FIELDS: Final[List[str]] = ['comments']
+
+R = TypeVar('R', bound=RedditContent)
+
+
+def request_fields(cls: Type[RedditContent]) -> List[str]:
+    """Pushshift ``fields`` needed to fill every CSV column of ``cls``."""
+    return [f for f in cls.csv_fields() if f not in LOCAL_FIELDS]
+
+
+def iter_data(body: Union[bytes, str]) -> Generator[dict, None, None]:
+    """Yields each element of a response page's top-level ``data`` array.
+
+    Args:
+        body (bytes or str): The raw response body.
+
+    Yields:
+        dict: One decoded element of ``data`` at a time.
+    """
+    yield from (_fastjson or json).loads(body)['data']
+
+
+def decode_records(
+    body: Union[bytes, str],
+    factory: Callable[[dict], R]
+) -> Generator[R, None, None]:
+    """Builds a record with ``factory`` for each element of ``data``."""
+    for item in iter_data(body):
+        yield factory(item)
+
+
+def decode_by_id(body: Union[bytes, str]) -> Dict[str, dict]:
+    """Single-pass replacement for ``{s['id']: s for s in data}``."""
+    return {item['id']: item for item in iter_data(body)}
+
+
+def decode_comments(body: Union[bytes, str]) -> List[Comment]:
+    return list(decode_records(body, Comment))
+
+
+def decode_submissions(body: Union[bytes, str]) -> List[Submission]:
+    return list(decode_records(body, Submission))
@@ -0,0 +1,237 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import time
+from typing import Final, Iterator, Literal, Optional, Sequence, Set, Tuple
+
+import praw
+from praw.models.util import ExponentialCounter
+
+from .metrics import REGISTRY
+from .util import Sinks, _write_checkpoint, write_reports
+from ..common.reddit import Comment, Submission
+
+Kind = Literal['submissions', 'comments']
+
+KINDS: Final[Tuple[Kind, ...]] = ('submissions', 'comments')
+REDDIT_URL: Final[str] = 'https://www.reddit.com'
+# Seconds from posting to being written.
+LAG_BUCKETS: Final[Tuple[float, ...]] = (1., 5., 15., 30., 60., 120., 300., 900., 3600.)
+# Longest wait in seconds between polling rounds that find nothing new.
+MAX_WAIT: Final[int] = 16
+
+
+@dataclass
+class HighWaterMark:
+    """Creation time of the newest post seen, and the IDs created in that second.
+
+    Streams restart from Reddit's newest listing page, so after a restart
+    anything at or below the mark has already been written.
+    """
+    created_utc: int = 0
+    ids: Set[str] = field(default_factory=set)
+
+    def is_new(self, created_utc: int, id: str) -> bool:
+        return created_utc > self.created_utc or (
+            created_utc == self.created_utc and id not in self.ids
+        )
+
+    def advance(self, created_utc: int, id: str) -> None:
+        if created_utc > self.created_utc:
+            self.created_utc = created_utc
+            self.ids = set()
+        if created_utc == self.created_utc:
+            self.ids.add(id)
+
+    def to_json(self) -> dict:
+        return {'created_utc': self.created_utc, 'ids': sorted(self.ids)}
+
+    @classmethod
+    def from_json(cls, js: dict) -> 'HighWaterMark':
+        return cls(js['created_utc'], set(js['ids']))
+
+
+def _author(item) -> str:
+    return item.author.name if item.author else '[deleted]'
+
+
+def to_submission(post: praw.models.Submission) -> Submission:
+    """A PRAW submission in the Pushshift-shaped `common.reddit` form."""
+    return Submission({
+        'author': _author(post),
+        'created_utc': int(post.created_utc),
+        'id': post.id,
+        'score': post.score,
+        'subreddit': post.subreddit.display_name,
+        'full_link': f'{REDDIT_URL}{post.permalink}',
+        'selftext': post.selftext,
+        'title': post.title,
+    })
+
+
+def to_comment(comment: praw.models.Comment) -> Comment:
+    """A PRAW comment in the Pushshift-shaped `common.reddit` form."""
+    return Comment({
+        'author': _author(comment),
+        'created_utc': int(comment.created_utc),
+        'id': comment.id,
+        'score': comment.score,
+        'subreddit': comment.subreddit.display_name,
+        'body': comment.body,
+        'is_submitter': comment.is_submitter,
+        'link_id': comment.link_id,
+        'parent_id': comment.parent_id,
+    })
+
+
+def multiplex(
+    reddit_conn: praw.Reddit,
+    subreddits: Sequence[str],
+    kinds: Sequence[Kind] = KINDS
+) -> Iterator[Optional[Tuple[Kind, object]]]:
+    """One stream of new (kind, PRAW item) pairs from several subreddits.
+
+    All subreddits are read through a single ``a+b`` multireddit listing per
+    kind, so each poll costs one request per kind however many subreddits
+    there are. PRAW isn't thread-safe, so instead of a reader thread per
+    listing the streams take turns in this generator: each yields what its
+    latest request returned, then None marks the end of the round. With
+    ``pause_after=-1`` PRAW returns after every request without waiting, so
+    after a round with nothing new this generator sleeps, doubling the
+    wait up to `MAX_WAIT` seconds while the listings stay quiet and going
+    back to 1 second once something arrives. Items of each kind come
+    oldest first.
+    """
+    subreddit = reddit_conn.subreddit('+'.join(subreddits))
+    streams = {kind: getattr(subreddit.stream, kind)(pause_after=-1) for kind in kinds}
+    backoff = ExponentialCounter(max_counter=MAX_WAIT)
+    while True:
+        found = False
+        for kind, stream in streams.items():
+            REGISTRY.counter('polls_total', kind=kind).inc()
+            for item in stream:
+                if item is None:
+                    break
+                found = True
+                yield kind, item
+        yield None
+        if found:
+            backoff.reset()
+        else:
+            time.sleep(backoff.counter())
+
+
+def ingest(
+    reddit_conn: praw.Reddit,
+    subreddits: Sequence[str] = ('SuicideWatch', ),
+    since: Optional[timedelta] = None,
+    output_dir: str = 'data/input',
+    fmt: Literal['csv', 'jsonl'] = 'csv',
+    prometheus_file: Optional[str] = None,
+    dedup: Optional[float] = None,
+    rollup: Optional[Literal['second', 'minute', 'hour', 'day']] = None,
+    duration: Optional[timedelta] = None,
+    max_items: Optional[int] = None
+) -> str:
+    """Continuously writes new submissions and comments as they are posted.
+
+    The continuous counterpart of the `dt.timedelta` overload of
+    `praw_reddit.parse_subreddit`: rather than walking ``new`` from the top
+    on every call, submissions and comments of all `subreddits` are
+    streamed (see `multiplex`) into the same files `scrape_until` writes,
+    through `util.Sinks`, under the prefix ``<output_dir>/<subreddits>-live``.
+    After every polling round that wrote posts, the files are flushed, the
+    dedup index and rollup saved (see `util.Sinks.flush`) and a high-water
+    mark per kind is saved to ``<prefix>-checkpoint.json``, so a restarted
+    ingest appends without repeating posts. Posts that only show up in a
+    listing after newer ones were written (e.g. approved from the spam
+    filter) are skipped.
+
+    Runs until `duration` has passed, `max_items` posts have been written
+    or it is interrupted (Ctrl-C stops it cleanly).
+
+    Args:
+        reddit_conn (praw.Reddit): See `praw_reddit.connect_and_configure`.
+        subreddits (Sequence[str], optional): Subreddits to follow together.
+        since (timedelta, optional): On the first run, also write posts
+            from this long ago that are still on the newest listing page
+            (at most 100 per kind). By default only posts from the start
+            of the run onwards.
+        output_dir (str, optional): Created if missing.
+        fmt (str, optional): 'csv' or 'jsonl' for the submission and comment
+            files.
+        prometheus_file (str, optional): See `scrape_until`.
+        dedup (float, optional): See `scrape_until`.
+        rollup (str, optional): See `scrape_until`.
+        duration (timedelta, optional): Stop after this long.
+        max_items (int, optional): Stop after writing this many posts.
+
+    Returns:
+        str: The output path prefix.
+    """
+    prefix = os.path.join(output_dir, f'{"+".join(subreddits)}-live')
+    checkpoint_path = f'{prefix}-checkpoint.json'
+    append = os.path.exists(checkpoint_path)
+    if append:
+        with open(checkpoint_path, 'r') as f:
+            checkpoint = json.load(f)
+        marks = {k: HighWaterMark.from_json(checkpoint['marks'][k]) for k in KINDS}
+        print(f'Resuming {prefix} after {marks["submissions"].created_utc}.')
+    else:
+        start = datetime.now(timezone.utc) - (since or timedelta())
+        checkpoint = {'submissions': 0, 'comments': 0}
+        marks = {k: HighWaterMark(int(start.timestamp())) for k in KINDS}
+    os.makedirs(output_dir, exist_ok=True)
+
+    REGISTRY.reset()
+    sinks = Sinks(
+        prefix, fmt, append, dedup, rollup,
+        submissions=checkpoint['submissions'], comments=checkpoint['comments']
+    )
+
+    def save() -> None:
+        sinks.flush()
+        checkpoint.update(
+            submissions=sinks.submissions,
+            comments=sinks.comments,
+            marks={k: m.to_json() for k, m in marks.items()}
+        )
+        _write_checkpoint(checkpoint_path, checkpoint)
+
+    deadline = time.monotonic() + duration.total_seconds() if duration is not None else None
+    written = saved = 0
+    try:
+        for event in multiplex(reddit_conn, subreddits):
+            if event is None:
+                if written > saved:
+                    save()
+                    saved = written
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                continue
+
+            kind, item = event
+            created = int(item.created_utc)
+            if not marks[kind].is_new(created, item.id):
+                REGISTRY.counter('stale_total', kind=kind).inc()
+                continue
+            with REGISTRY.stage('write'):
+                if kind == 'submissions':
+                    sinks.write_submission(to_submission(item))
+                else:
+                    sinks.write_comment(to_comment(item))
+                marks[kind].advance(created, item.id)
+            REGISTRY.records('write', 1)
+            REGISTRY.histogram('lag_seconds', LAG_BUCKETS, kind=kind).observe(time.time() - created)
+            written += 1
+            if max_items is not None and written >= max_items:
+                break
+    except KeyboardInterrupt:
+        print('Stopping.')
+    finally:
+        save()
+        sinks.close()
+        write_reports(prefix, prometheus_file, sinks)
+    print(f'DONE. Wrote {sinks.submissions} submissions and {sinks.comments} comments.')
+    return prefix
@@ -1,4 +1,134 @@
+import argparse
+import cProfile
+from datetime import datetime, timedelta, timezone
+import pstats
+from typing import List, Optional
+
 from .util import scrape_until
 
+
+def _utc(value: str) -> datetime:
+    """Parses an ISO date/datetime or a Unix timestamp as UTC."""
+    if value.isdigit():
+        return datetime.fromtimestamp(int(value), timezone.utc)
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='python -m stigmapyze.scraping.main',
+        description='Scrape Reddit submissions and comments from Pushshift, '
+        'or follow them live through the Reddit API with --live.'
+    )
+    parser.add_argument(
+        '-s', '--subreddit', dest='subreddits', action='append',
+        help='subreddit to scrape (repeatable); by default SuicideWatch'
+    )
+    parser.add_argument('--after', type=_utc, help='range start: ISO date or Unix time')
+    parser.add_argument('--before', type=_utc, help='range end; by default now')
+    parser.add_argument(
+        '--days', type=float, default=30,
+        help='range length when --after is not given (default: 30)'
+    )
+    parser.add_argument('--size', type=int, default=500, help='submissions per page')
+    parser.add_argument(
+        '-j', '--concurrency', type=int, default=1,
+        help='submissions whose comments are fetched in parallel'
+    )
+    parser.add_argument('-f', '--format', dest='fmt', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument('-o', '--output-dir', default='data/input')
+    parser.add_argument(
+        '--resume', action='store_true',
+        help='continue an interrupted run from its checkpoint (the newest one '
+        'for these subreddits unless --after/--before are given)'
+    )
+    parser.add_argument('--archive-dir', help='keep raw response pages in a RawArchive here')
+    parser.add_argument('--prometheus', help='also write metrics in Prometheus text format')
+    parser.add_argument(
+        '--dedup', type=float, nargs='?', const=.8, metavar='THRESHOLD',
+        help='cluster near-duplicate posts and only queue one per cluster for '
+        'tagging (default threshold: 0.8)'
+    )
+    parser.add_argument(
+        '--rollup', choices=['second', 'minute', 'hour', 'day'],
+        help='update the activity rollup of this bucket width in the output directory'
+    )
+    parser.add_argument(
+        '--live', metavar='CONFIG',
+        help='stream new posts through PRAW until interrupted, using this '
+        'config.json (client_id, client_secret, user_agent); range and '
+        'Pushshift options are ignored'
+    )
+    parser.add_argument(
+        '--live-since', type=float, metavar='MINUTES',
+        help='on the first --live run, also write posts up to this old'
+    )
+    parser.add_argument(
+        '--live-for', type=float, metavar='MINUTES',
+        help='stop --live after this long'
+    )
+    parser.add_argument(
+        '--profile', action='store_true',
+        help='write a cProfile dump (<prefix>-profile.pstats) and its summary'
+    )
+    args = parser.parse_args(argv)
+    # A bare --resume continues the newest run, whatever its range was.
+    if args.after is None and not args.resume:
+        end = args.before or datetime.now(timezone.utc)
+        args.after = end - timedelta(days=args.days)
+    return args
+
+
+def _minutes(value: Optional[float]) -> Optional[timedelta]:
+    return timedelta(minutes=value) if value is not None else None
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    if args.live:
+        from .live import ingest
+        from .praw_reddit import connect_and_configure
+
+        scrape = ingest
+        kwargs = dict(
+            reddit_conn=connect_and_configure(args.live),
+            subreddits=args.subreddits or ['SuicideWatch'],
+            since=_minutes(args.live_since),
+            output_dir=args.output_dir,
+            fmt=args.fmt,
+            prometheus_file=args.prometheus,
+            dedup=args.dedup,
+            rollup=args.rollup,
+            duration=_minutes(args.live_for),
+        )
+    else:
+        scrape = scrape_until
+        kwargs = dict(
+            subreddits=args.subreddits or ['SuicideWatch'],
+            after=args.after,
+            before=args.before,
+            size=args.size,
+            concurrency=args.concurrency,
+            output_dir=args.output_dir,
+            fmt=args.fmt,
+            resume=args.resume,
+            prometheus_file=args.prometheus,
+            archive_dir=args.archive_dir,
+            dedup=args.dedup,
+            rollup=args.rollup,
+        )
+    if not args.profile:
+        scrape(**kwargs)
+        return
+
+    profiler = cProfile.Profile()
+    prefix = profiler.runcall(scrape, **kwargs)
+    profiler.dump_stats(f'{prefix}-profile.pstats')
+    with open(f'{prefix}-profile.txt', 'w') as f:
+        pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(40)
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+
+
 if __name__ == '__main__':
-    scrape_until()
+    main()
@@ -0,0 +1,262 @@
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import threading
+from time import perf_counter
+from typing import Dict, Final, Generator, List, Optional, TextIO, Tuple
+
+LATENCY_BUCKETS: Final[Tuple[float, ...]] = (
+    .05, .1, .25, .5, 1., 2.5, 5., 10., 30., 60.
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    """Monotonically increasing value (requests made, records written...)."""
+
+    def __init__(self) -> None:
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self) -> dict:
+        return {'value': self.value}
+
+
+class Gauge:
+    """Value that can go up and down (queue depths); also tracks its peak."""
+
+    def __init__(self) -> None:
+        self.value = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = value
+            self.peak = max(self.peak, value)
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+            self.peak = max(self.peak, self.value)
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def snapshot(self) -> dict:
+        return {'value': self.value, 'peak': self.peak}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the style of Prometheus."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            else:
+                self.counts[-1] += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total, out = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            out.append(('+Inf' if bound == float('inf') else str(bound), total))
+        return out
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.,
+            'buckets': dict(self.cumulative()),
+        }
+
+
+class Registry:
+    """In-process store of named, labelled metrics.
+
+    Metrics are created on first access, so instrumented code only ever needs
+    to name the metric it wants, e.g.
+    ``REGISTRY.counter('retries_total', flag='HTTPERROR').inc()``.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Dict[LabelKey, object]] = {}
+        self._kinds: Dict[str, type] = {}
+        self._lock = threading.Lock()
+        self.started = datetime.utcnow()
+
+    def _get(self, kind: type, name: str, labels: Dict[str, str], **kwargs):
+        key: LabelKey = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            if self._kinds.setdefault(name, kind) is not kind:
+                raise TypeError(
+                    f'{name} is a {self._kinds[name].__name__}, not a {kind.__name__}'
+                )
+            series = self._metrics.setdefault(name, {})
+            if key not in series:
+                series[key] = kind(**kwargs)
+            return series[key]
+
+    def counter(self, name: str, **labels: str) -> Counter:
+        return self._get(Counter, name, labels)
+
+    def gauge(self, name: str, **labels: str) -> Gauge:
+        return self._get(Gauge, name, labels)
+
+    def histogram(
+        self,
+        name: str,
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+        **labels: str
+    ) -> Histogram:
+        return self._get(Histogram, name, labels, buckets=buckets)
+
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Generator[None, None, None]:
+        """Observes the wall time of the enclosed block into a histogram."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name, **labels).observe(perf_counter() - start)
+
+    @contextmanager
+    def stage(self, stage: str) -> Generator[None, None, None]:
+        """Accumulates wall time spent in a named pipeline stage.
+
+        Paired with ``records(stage)`` this gives records/sec per stage in the
+        run report.
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.counter('stage_seconds_total',
+                         stage=stage).inc(perf_counter() - start)
+
+    def records(self, stage: str, amount: int = 1) -> None:
+        self.counter('records_total', stage=stage).inc(amount)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._metrics.clear()
+            self._kinds.clear()
+            self.started = datetime.utcnow()
+
+    def snapshot(self) -> Dict[str, List[dict]]:
+        with self._lock:
+            metrics = {n: dict(s) for n, s in self._metrics.items()}
+        return {
+            name: [
+                {'labels': dict(key), **metric.snapshot()}
+                for key, metric in sorted(series.items())
+            ]
+            for name, series in sorted(metrics.items())
+        }
+
+    def stage_rates(self) -> Dict[str, float]:
+        """Records/sec for every stage that has both records and time."""
+        snap = self.snapshot()
+        seconds = {
+            s['labels']['stage']: s['value']
+            for s in snap.get('stage_seconds_total', [])
+        }
+        return {
+            s['labels']['stage']: s['value'] / seconds[s['labels']['stage']]
+            for s in snap.get('records_total', [])
+            if seconds.get(s['labels']['stage'])
+        }
+
+    def report(self, **extra) -> dict:
+        """Builds the machine-readable run report."""
+        finished = datetime.utcnow()
+        return {
+            'started': self.started.isoformat(),
+            'finished': finished.isoformat(),
+            'elapsed_seconds': (finished - self.started).total_seconds(),
+            'records_per_second': self.stage_rates(),
+            'metrics': self.snapshot(),
+            **extra,
+        }
+
+    def write_report(self, fp: TextIO, **extra) -> None:
+        json.dump(self.report(**extra), fp, indent=4)
+
+    def prometheus(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            metrics = {n: dict(s) for n, s in self._metrics.items()}
+            kinds = dict(self._kinds)
+        for name, series in sorted(metrics.items()):
+            kind = kinds[name].__name__.lower()
+            lines.append(f'# TYPE stigmapyze_{name} {kind}')
+            for key, metric in sorted(series.items()):
+                if isinstance(metric, Histogram):
+                    for bound, total in metric.cumulative():
+                        lbl = _labels(key + (('le', bound),))
+                        lines.append(f'stigmapyze_{name}_bucket{lbl} {total}')
+                    lines.append(f'stigmapyze_{name}_sum{_labels(key)} {metric.sum}')
+                    lines.append(
+                        f'stigmapyze_{name}_count{_labels(key)} {metric.count}'
+                    )
+                else:
+                    lines.append(f'stigmapyze_{name}{_labels(key)} {metric.value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, fp: TextIO) -> None:
+        fp.write(self.prometheus())
+
+
+def _labels(key: LabelKey) -> str:
+    if not key:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in key) + '}'
+
+
+class CountingWriter:
+    """File wrapper counting bytes written to it under ``bytes_written_total``.
+
+    Drop-in for the file objects handed to ``csv.DictWriter``.
+    """
+
+    def __init__(
+        self,
+        fp: TextIO,
+        output: str,
+        registry: Optional[Registry] = None
+    ) -> None:
+        self._fp = fp
+        self._counter = (registry or REGISTRY).counter(
+            'bytes_written_total', output=output
+        )
+
+    def write(self, s: str) -> int:
+        n = self._fp.write(s)
+        self._counter.inc(len(s.encode('utf-8')))
+        return n
+
+    def __getattr__(self, attr: str):
+        return getattr(self._fp, attr)
+
+
+REGISTRY: Final[Registry] = Registry()
@@ -88,7 +88,8 @@ def _(
     (timedelta) from the current time. The number of posts parsed will thus be
     dependent on the activity level of the subreddit accessed--subreddits with
     more activity will return a higher number of posts for a given timeframe
-    than those with less.
+    than those with less. Every call walks the listing from the newest post
+    again; to keep following subreddits, use `live.ingest`.
 
     Args:
         post_limit (dt.timedelta): Time to subtract from the present moment to
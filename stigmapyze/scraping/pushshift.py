@@ -1,13 +1,15 @@
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum, Flag, auto
 
-import pandas as pd
-import re
 import requests
 from time import sleep
-from typing import Any, Dict, Final, Generator, List, Literal, Optional, Tuple, Union, overload
+from typing import Any, Dict, Final, Generator, Iterable, List, Literal, Optional, Set, Tuple, Union, overload
 
+from .archive import RawArchive
+from .decoding import decode_by_id, decode_comments, decode_records, iter_data, request_fields
+from .metrics import REGISTRY
 from ..common.reddit import Comment, Submission
 
 BASEURL: Final[str] = 'https://api.pushshift.io/reddit'
@@ -40,6 +42,23 @@ class Endpoint(Enum):
     def __call__(self, *args: Any, **kwds: Any) -> Any:
         return f'{self.value}/' + str(*args)
 
+    def get(self, query: str) -> requests.Response:
+        """GETs a query built from this endpoint, recording its latency."""
+        with REGISTRY.timer('http_latency_seconds', endpoint=self.name):
+            resp = requests.get(query)
+        REGISTRY.counter(
+            'http_responses_total', endpoint=self.name, status=resp.status_code
+        ).inc()
+        return resp
+
+
+def _join(fields: Union[str, List[str]]) -> str:
+    return fields if isinstance(fields, str) else ','.join(fields)
+
+
+def count_retry(flag: PSFlag) -> None:
+    REGISTRY.counter('retries_total', flag=flag.name).inc()
+
 
 def check_loop_err(err: PSReturn, flag: PSFlag, submissions: List[Submission]):
     if err and err.flag == PSFlag.HTTPERROR:
@@ -67,7 +86,22 @@ def query_comments(
     before: datetime = None,
     frequency: Literal["second", "minute", "hour", "day"] = None,
     metadata: bool = False,
-) -> Dict[str, dict]:
+    records: bool = False,
+    archive: Optional[RawArchive] = None,
+) -> Union[Dict[str, dict], List[Comment]]:
+    """Queries the Pushshift comment search endpoint.
+
+    By default only the fields needed to fill ``Comment.csv_fields()`` are
+    requested; pass ``fields=[]`` to get every field Pushshift has. When an
+    `archive` is given, every field is requested by default and the raw page
+    is stored in it.
+
+    Returns:
+        Dict[str, dict]: The raw comments keyed by ID, or if ``records`` is
+            True, a list of ``Comment`` built directly from the page.
+    """
+    if fields is None:
+        fields = [] if archive else request_fields(Comment)
     formatted_params: List[str] = list(
         filter(
             lambda l: l,
@@ -75,10 +109,10 @@ def query_comments(
                 f'q={q}' if q else None,
                 f'ids={",".join(ids)}' if ids else None,
                 f'size={size}',
-                f'fields={",".join(fields)}' if fields else None,
+                f'fields={_join(fields)}' if fields else None,
                 f'sort={sort}',
                 f'sort_type={sort_type}',
-                f'aggs={aggs}',
+                f'aggs={aggs}' if aggs else None,
                 f'author={author}' if author else None,
                 f'subreddit={subreddit}' if subreddit else None,
                 f'after={after}' if after else None,
@@ -93,8 +127,9 @@ def query_comments(
     err: PSReturn = None
 
     while True:
-        resp = requests.get(query)
+        resp = Endpoint.COMMENT.get(query)
         if resp.status_code != 200:
+            count_retry(PSFlag.HTTPERROR)
             if err and err.flag == PSFlag.HTTPERROR:
                 if err._errcount == ERRLIMIT:
                     raise ConnectionRefusedError(
@@ -109,17 +144,29 @@ def query_comments(
         else:
             break
 
-    data = resp.json()['data']
-    comments: Dict = {s['id']: s for s in data}
+    if archive is not None:
+        with REGISTRY.stage('archive'):
+            REGISTRY.records('archive', archive.write_page('comments', resp.content))
+
+    with REGISTRY.stage('parse_comments'):
+        if records:
+            comments = decode_comments(resp.content)
+        else:
+            comments = decode_by_id(resp.content)
+    REGISTRY.records('parse_comments', len(comments))
     return comments
 
 
-def query_submission_comments(submission_id: str) -> Dict[str, dict]:
+def query_submission_comments(
+    submission_id: str,
+    archive: Optional[RawArchive] = None
+) -> List[Comment]:
     err: PSReturn = None
     query = Endpoint.SUBMCOMMENTS(submission_id)
     while True:
-        resp = requests.get(query)
+        resp = Endpoint.SUBMCOMMENTS.get(query)
         if resp.status_code != 200:
+            count_retry(PSFlag.HTTPERROR)
             if err and err.flag == PSFlag.HTTPERROR:
                 if err._errcount == ERRLIMIT:
                     raise ConnectionRefusedError(
@@ -134,11 +181,10 @@ def query_submission_comments(submission_id: str) -> Dict[str, dict]:
         else:
             break
 
-    comments = list(
-        query_comments(ids=[id for id in resp.json()['data']]).values()
-    )
-    # comments = {id: query_comments(id)[id] for id in resp.json()['data']}
-    return comments
+    ids = list(iter_data(resp.content))
+    if not ids:
+        return []
+    return query_comments(ids=ids, records=True, archive=archive)
 
 
 def query_submissions(
@@ -162,7 +208,30 @@ def query_submissions(
     frequency: Literal["second", "minute", "hour", "day"] = None,
     metadata: bool = False,
     with_comments: bool = True,
-) -> Generator[Submission, None, None]:
+    archive: Optional[RawArchive] = None,
+    concurrency: int = 1,
+    exclude_ids: Optional[Iterable[str]] = None,
+    pages: bool = False,
+) -> Generator[Union[Submission, List[Submission]], None, None]:
+    """Pages through the Pushshift submission search endpoint, oldest first.
+
+    Pushshift's ``after`` is exclusive, so each next page starts one second
+    before the newest submission seen and drops the IDs already yielded from
+    that second; posts sharing a second across a page boundary aren't lost.
+    Paging stops cleanly at the first page with nothing new.
+
+    Args:
+        exclude_ids (Iterable[str], optional): IDs created in the second
+            after `after` that were already handled, e.g. by an earlier run.
+        pages (bool, optional): Yield each page's new submissions as a list
+            instead of one by one.
+
+    Yields:
+        Submission: Submissions created between `after` and `before`, with
+            their comments if `with_comments`; or lists of them if `pages`.
+    """
+    if fields is None:
+        fields = [] if archive else request_fields(Submission)
     before = int(datetime.utcnow().timestamp()) if not before else before
     formatted_params: List[str] = list(
         filter(
@@ -176,13 +245,12 @@ def query_submissions(
                 f'selftext={selftext}' if selftext else None,
                 f'selftext:not={selftext_not}' if selftext_not else None,
                 f'size={size}',
-                f'fields={",".join(fields)}' if fields else None,
+                f'fields={_join(fields)}' if fields else None,
                 f'sort={sort}',
                 f'sort_type={sort_type}',
                 f'aggs={aggs}' if aggs else None,
                 f'author={author}' if author else None,
                 f'subreddit={subreddit}' if subreddit else None,
-                f'after={after}' if after else None,
                 f'before={before}' if before else None,
                 f'score={score}' if score else None,
                 f'frequency={frequency}' if frequency else None,
@@ -191,70 +259,78 @@ def query_submissions(
         )
     )
 
-    submissions: List[Submission] = []
     param_str: str = f'?{"&".join(formatted_params)}'
+    seen: Set[str] = set(exclude_ids or ())
     err: Optional[PSReturn] = None
     prev_time = datetime.now()
 
     while True:
-        query: str = Endpoint.SUBMISSION(param_str)
-        data = requests.get(query)
+        query: str = Endpoint.SUBMISSION(param_str + (f'&after={after}' if after else ''))
+        with REGISTRY.stage('fetch'):
+            data = Endpoint.SUBMISSION.get(query)
         if data.status_code != 200:
+            count_retry(PSFlag.HTTPERROR)
             if err and err.flag == PSFlag.HTTPERROR:
                 if err._errcount == ERRLIMIT:
-                    raise ConnectionRefusedError(
-                        f'HTTP {data.status_code}: {submissions[-1].created_utc}'
-                    )
+                    raise ConnectionRefusedError(f'HTTP {data.status_code}: after={after}')
                 err._errcount += 1
             else:
                 err = PSReturn(None, PSFlag.HTTPERROR, 1)
             print(f'HTTP {data.status_code} {err._errcount}/{ERRLIMIT}')
             sleep(5)
             continue
+        err = None
 
-        posts: Dict = {s['id']: s for s in data.json()['data']}
-        if with_comments:
-            subm = [
-                Submission(posts[k], query_submission_comments(k))
-                for k in posts.keys()
-            ]
-        else:
-            subm = [Submission(posts[k]) for k in posts.keys()]
-
-        if len(subm) == 0:
-            if err and err.flag == PSFlag.SUBMLENERROR:
-                if err._errcount == ERRLIMIT:
-                    raise ValueError(
-                        f'Empty subm: {submissions[-1].created_utc}'
-                    )
-                err._errcount += 1
-            else:
-                err = PSReturn(None, PSFlag.SUBMLENERROR, 1)
-            sleep(1)
+        if archive is not None:
+            with REGISTRY.stage('archive'):
+                REGISTRY.records(
+                    'archive', archive.write_page('submissions', data.content)
+                )
+        with REGISTRY.stage('parse'):
+            page = sorted(decode_records(data.content, Submission), key=lambda s: s.created_utc)
+        REGISTRY.records('fetch', len(page))
+        REGISTRY.records('parse', len(page))
+        submissions = [s for s in page if s.id not in seen and s.created_utc < before]
+        if not submissions:
+            if len(page) < size:
+                print(f'({datetime.now().strftime("%Y-%m-%dT%H:%M:%S%Z")}) No new submissions after {after}.\n')
+                break
+            # A full page from a single second: the rest of it can't be
+            # paged to, so move past it.
+            after, seen = int(page[-1].created_utc), set()
             continue
 
-        submissions = sorted(subm, key=lambda s: s.created_utc)
-        # print(f'#submissions: {len(submissions)} (subm: {len(subm)})')
-        # print(f'last: {datetime.fromtimestamp(submissions[-1].created_utc)}')
+        if with_comments:
+            with REGISTRY.stage('comments'):
+                if concurrency > 1:
+                    with ThreadPoolExecutor(concurrency) as pool:
+                        fetched = list(pool.map(
+                            lambda s: query_submission_comments(s.id, archive), submissions
+                        ))
+                    for s, comments in zip(submissions, fetched):
+                        s.comments = comments
+                else:
+                    for s in submissions:
+                        s.comments = query_submission_comments(s.id, archive)
+            REGISTRY.records('comments', sum(len(s.comments) for s in submissions))
 
         nsubs = len(submissions)
-        if submissions[-1].created_utc >= before or nsubs == 0:
-            for sub in submissions:
-                yield sub
-            print(
-                f'({prev_time.strftime("%Y-%m-%dT%H:%M:%S%Z")}) Finished batch of {nsubs} in {str(datetime.now() - prev_time)}.\n'
-            )
-            break
-            # return submissions, PSReturn(submissions[-1].created_utc, PSFlag.DONE)
+        last = int(submissions[-1].created_utc)
+        if after is None or last > after + 1:
+            seen = set()
+        seen.update(s.id for s in submissions if s.created_utc == last)
+        after = last - 1
+
+        pending = REGISTRY.gauge('queue_depth', queue='submissions')
+        pending.set(nsubs)
+        if pages:
+            yield submissions
+            pending.set(0)
         else:
-            new_after = f'after={submissions[-1].created_utc}'
             for sub in submissions:
+                pending.dec()
                 yield sub
-
-            print(
-                f'({datetime.now().strftime("%Y-%m-%dT%H:%M:%S%Z")}) Finished batch of {nsubs} in {str(datetime.now() - prev_time)} (last {new_after}).\n'
-            )
-            prev_time = datetime.now()
-            param_str = re.sub(
-                r'([&?])after=.*([&$])', f'\g<1>{new_after}\g<2>', param_str
-            )
+        print(
+            f'({datetime.now().strftime("%Y-%m-%dT%H:%M:%S%Z")}) Finished batch of {nsubs} in {str(datetime.now() - prev_time)} (last after={after}).\n'
+        )
+        prev_time = datetime.now()
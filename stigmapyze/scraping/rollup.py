@@ -0,0 +1,380 @@
+from bisect import bisect_left
+from csv import DictReader, DictWriter
+from dataclasses import dataclass, field
+from datetime import datetime
+import json
+import os
+from typing import Dict, Final, Iterator, List, Literal, Optional, Sequence, Set, TextIO, Tuple
+
+from .metrics import REGISTRY
+from .pushshift import Endpoint
+from .util import STIGMA_HEADER
+
+Frequency = Literal['second', 'minute', 'hour', 'day']
+Kind = Literal['submissions', 'comments']
+
+FREQUENCY_SECONDS: Final[Dict[str, int]] = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+}
+LABELS: Final[List[str]] = STIGMA_HEADER[1:]
+KINDS: Final[Dict[str, Kind]] = {'Submission': 'submissions', 'Comment': 'comments'}
+
+Key = Tuple[str, str, int]
+
+
+def bucket_start(created_utc: int, frequency: Frequency) -> int:
+    width = FREQUENCY_SECONDS[frequency]
+    return int(created_utc) // width * width
+
+
+def ids_path(path: str) -> str:
+    """Where the IDs already counted (or labeled) in the rollup at `path` are kept."""
+    return f'{os.path.splitext(path)[0]}-ids.txt'
+
+
+@dataclass
+class Bucket:
+    count: int = 0
+    score_sum: float = 0.
+    labeled: int = 0
+    label_sums: List[float] = field(default_factory=lambda: [0.] * len(LABELS))
+    # Posts in `score_sum`; differs from `count` once counts come from
+    # Pushshift aggregations (see `RollupIndex.merge_counts`).
+    scored: int = 0
+
+    @property
+    def mean_score(self) -> Optional[float]:
+        return self.score_sum / self.scored if self.scored else None
+
+    def prevalence(self) -> Dict[str, Optional[float]]:
+        """Fraction of labeled posts carrying each stigma/challenge cue."""
+        return {
+            l: (s / self.labeled if self.labeled else None)
+            for l, s in zip(LABELS, self.label_sums)
+        }
+
+
+class RollupIndex:
+    """Activity per (kind, subreddit, time bucket), updated as posts arrive.
+
+    Each post adds O(1) work to its bucket's running count, score sum and,
+    once tagged, label sums, so charts of activity or label prevalence read
+    precomputed buckets instead of rescanning the scraped corpus. Keys are
+    kept sorted, so a time range is found by bisection and read in
+    O(buckets in range). Saved as a small CSV that later runs load and keep
+    adding to; the IDs of the posts counted and labeled are saved beside
+    it, so a post scraped again by an overlapping or resumed run, or a
+    stigma CSV ingested again, isn't counted twice.
+
+    Attributes:
+        frequency (str): Bucket width: 'second', 'minute', 'hour' or 'day'.
+        buckets (Dict[Tuple[str, str, int], Bucket]): Keyed by kind,
+            subreddit and bucket start (Unix time).
+        counted (Set[str]): IDs of the posts added with an ID.
+        labeled (Set[str]): IDs of the posts whose labels were added.
+    """
+
+    def __init__(self, frequency: Frequency = 'hour') -> None:
+        self.frequency = frequency
+        self.buckets: Dict[Key, Bucket] = {}
+        self.counted: Set[str] = set()
+        self.labeled: Set[str] = set()
+        self._keys: Optional[List[Key]] = None
+        # Adds since the last save, replayed if another run saved meanwhile;
+        # only kept once the index is tied to a file (see `open`).
+        self._pending: Optional[list] = None
+        self._mtime: Optional[int] = None
+        # Bytes of the ID log that `counted` and `labeled` reflect.
+        self._ids_size: Optional[int] = None
+
+    def _bucket(self, kind: Kind, subreddit: str, created_utc: int) -> Bucket:
+        key = (kind, (subreddit or '').lower(), bucket_start(created_utc, self.frequency))
+        b = self.buckets.get(key)
+        if b is None:
+            b = self.buckets[key] = Bucket()
+            self._keys = None
+        return b
+
+    def add(
+        self,
+        kind: Kind,
+        subreddit: str,
+        created_utc: int,
+        score: Optional[float] = None,
+        id: Optional[str] = None
+    ) -> bool:
+        """Counts one post, unless a post with the same `id` already was."""
+        if id is not None:
+            if id in self.counted:
+                return False
+            self.counted.add(id)
+        if self._pending is not None:
+            self._pending.append(('add', (kind, subreddit, created_utc, score, id)))
+        b = self._bucket(kind, subreddit, created_utc)
+        b.count += 1
+        if score is not None:
+            b.score_sum += score
+            b.scored += 1
+        return True
+
+    def add_labels(
+        self,
+        kind: Kind,
+        subreddit: str,
+        created_utc: int,
+        labels: Sequence[float],
+        id: Optional[str] = None
+    ) -> bool:
+        """Counts one tagged post, unless the post with this `id` already was.
+
+        `labels` is in `STIGMA_HEADER[1:]` order.
+        """
+        if id is not None:
+            if id in self.labeled:
+                return False
+            self.labeled.add(id)
+        if self._pending is not None:
+            self._pending.append(('add_labels', (kind, subreddit, created_utc, labels, id)))
+        b = self._bucket(kind, subreddit, created_utc)
+        b.labeled += 1
+        for i, v in enumerate(labels):
+            b.label_sums[i] += v
+        return True
+
+    def merge_counts(self, kind: Kind, subreddit: str, counts: Dict[int, int]) -> None:
+        """Sets bucket counts from server-side aggregations (bucket -> count).
+
+        Scores aren't aggregated server-side, so `Bucket.mean_score` stays
+        the mean over the posts added locally.
+        """
+        for start, n in counts.items():
+            self._bucket(kind, subreddit, start).count = n
+
+    def between(
+        self,
+        kind: Kind,
+        subreddit: str,
+        after: Optional[int] = None,
+        before: Optional[int] = None
+    ) -> Iterator[Tuple[int, Bucket]]:
+        """(bucket start, Bucket) with `after` <= start < `before`, in order."""
+        if self._keys is None:
+            self._keys = sorted(self.buckets)
+        sub = (subreddit or '').lower()
+        lo = bisect_left(self._keys, (kind, sub, after if after is not None else -1))
+        for key in self._keys[lo:]:
+            if key[:2] != (kind, sub) or (before is not None and key[2] >= before):
+                return
+            yield key[2], self.buckets[key]
+
+    def frame(
+        self,
+        kind: Kind,
+        subreddit: str,
+        after: Optional[int] = None,
+        before: Optional[int] = None
+    ):
+        """The range as a DataFrame indexed by bucket start, for plotting."""
+        import pandas as pd
+
+        rows = [
+            {
+                'bucket': datetime.utcfromtimestamp(start),
+                'count': b.count,
+                'mean_score': b.mean_score,
+                'labeled': b.labeled,
+                **b.prevalence(),
+            }
+            for start, b in self.between(kind, subreddit, after, before)
+        ]
+        columns = ['bucket', 'count', 'mean_score', 'labeled', *LABELS]
+        return pd.DataFrame(rows, columns=columns).set_index('bucket')
+
+    def save(self, path: str) -> None:
+        """Writes the buckets to `path` and the counted and labeled IDs to `ids_path(path)`.
+
+        The ID file is a log: IDs added since the last save are appended to
+        it and `path` records its length, so a save costs O(buckets + new
+        IDs) rather than O(every post ever counted), and a crash between
+        the two writes leaves the IDs appended after `path` out of it.
+
+        If another run saved `path` since this index was opened or last
+        saved, its state is loaded first and this run's adds (posts and
+        labels) are replayed on top, so runs sharing a directory don't
+        overwrite each other.
+        """
+        if self._pending is not None and _mtime(path) != self._mtime:
+            other = RollupIndex.load(path)
+            other._pending = []
+            for method, args in self._pending:
+                getattr(other, method)(*args)
+            self.buckets, self.counted, self.labeled = other.buckets, other.counted, other.labeled
+            self._pending, self._ids_size = other._pending, other._ids_size
+            self._keys = None
+
+        ids_size = self._write_ids(ids_path(path))
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', newline='') as f:
+            f.write(f'# frequency={self.frequency} ids={ids_size}\n')
+            writer = DictWriter(f, fieldnames=[
+                'kind', 'subreddit', 'bucket', 'count', 'score_sum', 'scored', 'labeled', *LABELS
+            ])
+            writer.writeheader()
+            for (kind, sub, start) in sorted(self.buckets):
+                b = self.buckets[(kind, sub, start)]
+                writer.writerow({
+                    'kind': kind,
+                    'subreddit': sub,
+                    'bucket': start,
+                    'count': b.count,
+                    'score_sum': b.score_sum,
+                    'scored': b.scored,
+                    'labeled': b.labeled,
+                    **dict(zip(LABELS, b.label_sums)),
+                })
+        os.replace(tmp, path)
+        self._pending = []
+        self._mtime = _mtime(path)
+        self._ids_size = ids_size
+
+    def _write_ids(self, path: str) -> int:
+        """Brings the ID log at `path` up to date and returns its length.
+
+        Appends the IDs added since the last save. The log is rewritten
+        in full (compacted) when this index didn't come from it, or it is
+        shorter than expected.
+        """
+        size = os.path.getsize(path) if os.path.exists(path) else None
+        if self._pending is None or self._ids_size is None or size is None or size < self._ids_size:
+            tmp = f'{path}.tmp'
+            with open(tmp, 'wb') as f:
+                f.writelines(f'counted\t{id}\n'.encode('utf-8') for id in sorted(self.counted))
+                f.writelines(f'labeled\t{id}\n'.encode('utf-8') for id in sorted(self.labeled))
+                size = f.tell()
+            os.replace(tmp, path)
+            return size
+        with open(path, 'r+b') as f:
+            # Drop anything a crashed save appended without recording it.
+            f.truncate(self._ids_size)
+            f.seek(self._ids_size)
+            for method, args in self._pending:
+                if args[-1] is not None:
+                    kind = 'labeled' if method == 'add_labels' else 'counted'
+                    f.write(f'{kind}\t{args[-1]}\n'.encode('utf-8'))
+            return f.tell()
+
+    @classmethod
+    def load(cls, path: str) -> 'RollupIndex':
+        with open(path, 'r', newline='') as f:
+            header = dict(kv.split('=', 1) for kv in f.readline().lstrip('#').split())
+            index = cls(header['frequency'])
+            for row in DictReader(f):
+                key = (row['kind'], row['subreddit'], int(row['bucket']))
+                index.buckets[key] = Bucket(
+                    count=int(row['count']),
+                    score_sum=float(row['score_sum']),
+                    labeled=int(row['labeled']),
+                    label_sums=[float(row[l]) for l in LABELS],
+                    # Files from before `scored` was kept.
+                    scored=int(row.get('scored') or row['count']),
+                )
+        if os.path.exists(ids_path(path)):
+            with open(ids_path(path), 'rb') as f:
+                # Files from before the length was recorded cover the whole log.
+                log = f.read(int(header['ids'])) if 'ids' in header else f.read()
+            for line in log.decode('utf-8').splitlines():
+                kind, _, id = line.rpartition('\t')
+                if id:
+                    # Untagged lines are from before labels were tracked.
+                    (index.labeled if kind == 'labeled' else index.counted).add(id)
+            index._ids_size = len(log)
+        return index
+
+    @classmethod
+    def open(cls, path: str, frequency: Frequency = 'hour') -> 'RollupIndex':
+        """Loads `path` if it exists, else starts an empty index, to be saved there."""
+        index = cls.load(path) if os.path.exists(path) else cls(frequency)
+        index._pending = []
+        index._mtime = _mtime(path)
+        return index
+
+
+def _mtime(path: str) -> Optional[int]:
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+
+def query_activity(
+    kind: Kind,
+    subreddit: str,
+    after: int,
+    before: int,
+    frequency: Frequency = 'hour'
+) -> Optional[Dict[int, int]]:
+    """Post counts per bucket computed by Pushshift, if it still supports aggs.
+
+    Returns:
+        Dict[int, int]: Count keyed by bucket start, or None when the
+            endpoint answers without aggregations (newer Pushshift versions
+            dropped them), in which case use a local `RollupIndex`.
+    """
+    endpoint = Endpoint.SUBMISSION if kind == 'submissions' else Endpoint.COMMENT
+    query = endpoint(
+        f'?subreddit={subreddit}&after={after}&before={before}'
+        f'&aggs=created_utc&frequency={frequency}&size=0'
+    )
+    with REGISTRY.stage('aggs'):
+        resp = endpoint.get(query)
+    if resp.status_code != 200:
+        return None
+    aggs = json.loads(resp.content).get('aggs', {}).get('created_utc')
+    if not aggs:
+        return None
+    return {
+        bucket_start(a['key'], frequency): int(a['doc_count'])
+        for a in aggs
+    }
+
+
+def _timestamp(value: str) -> int:
+    # CSVs written by `scrape_until` hold local times formatted with DATE_FORMAT.
+    if value.isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(value).timestamp())
+
+
+def ingest_labels(
+    index: RollupIndex,
+    stigma_file: TextIO,
+    submission_file: Optional[TextIO] = None,
+    comment_file: Optional[TextIO] = None
+) -> int:
+    """Adds the tagged rows of a stigma CSV to their posts' buckets.
+
+    Rows with no cue filled in, and cells of -1 (untaggable), are skipped as
+    in analysis.ipynb, as are rows already added to `index`, so the same CSV
+    can be ingested again as tagging progresses. Returns the number of rows
+    added.
+    """
+    posts: Dict[str, Tuple[str, int]] = {}
+    for kind, fp in (('Submission', submission_file), ('Comment', comment_file)):
+        if fp is None:
+            continue
+        for row in DictReader(fp):
+            posts[f'{kind} {row["id"]}'] = (
+                row.get('subreddit') or '', _timestamp(row['created_utc'])
+            )
+
+    n = 0
+    for row in DictReader(stigma_file):
+        values = [(row.get(l) or '').strip() for l in LABELS]
+        if row['ID'] not in posts or not any(v and v not in ('-1', '-1.0') for v in values):
+            continue
+        subreddit, created = posts[row['ID']]
+        labels = [float(v) if v and v not in ('-1', '-1.0') else 0. for v in values]
+        n += index.add_labels(
+            KINDS[row['ID'].split(' ', 1)[0]], subreddit, created, labels, id=row['ID']
+        )
+    return n
@@ -1,13 +1,17 @@
 from csv import DictWriter
-from datetime import datetime, timedelta
-from typing import Final, List, Literal
-
-import pandas as pd
+from datetime import datetime, timedelta, timezone
+import glob
+import json
+import os
+from typing import Final, List, Literal, Optional, Sequence, TextIO
 
+from .archive import RawArchive
+from .metrics import REGISTRY, CountingWriter
 from .pushshift import query_submissions
 from ..common.reddit import Comment, Submission
 
 DATE_FORMAT: Final[str] = '%Y-%m-%dT%H:%M:%S%Z'
+FILE_DATE_FORMAT: Final[str] = '%Y%m%dT%H%M%SZ'
 STIGMA_HEADER: Final[List[str]] = [
     'ID',
     'Stig_c1',
@@ -29,58 +33,324 @@ def stigma_row(id: str, type: Literal['Submission', 'Comment']) -> dict:
     return row
 
 
-def scrape_until():
-    now = datetime.utcnow()
-    after_date = (now - timedelta(days=30))
+class JsonLinesWriter:
+    """`csv.DictWriter` lookalike writing one JSON object per line."""
 
-    try:
-        sub_file = open(
-            f'data/input/{after_date.strftime(DATE_FORMAT)}-{now.strftime(DATE_FORMAT)}-submissions.csv',
-            'w'
-        )
-        sub_csv = DictWriter(sub_file, fieldnames=Submission.csv_fields())
-        sub_csv.writeheader()
+    def __init__(self, fp, fieldnames: List[str]) -> None:
+        self.fp = fp
+        self.fieldnames = fieldnames
 
-        cmt_file = open(
-            f'data/input/{after_date.strftime(DATE_FORMAT)}-{now.strftime(DATE_FORMAT)}-comments.csv',
-            'w'
-        )
-        cmt_csv = DictWriter(cmt_file, fieldnames=Comment.csv_fields())
-        cmt_csv.writeheader()
+    def writeheader(self) -> None:
+        ...
+
+    def writerow(self, row: dict) -> None:
+        self.fp.write(json.dumps({f: row.get(f) for f in self.fieldnames}) + '\n')
+
+
+class Sinks:
+    """The files a scraping run writes posts to.
+
+    Shared by `scrape_until` and `live.ingest`, so both produce the same
+    ``<prefix>-submissions.<fmt>``, ``<prefix>-comments.<fmt>`` and
+    ``<prefix>-stigma.csv`` files, with the same optional near-duplicate
+    clustering and activity rollup (see `scrape_until`).
+
+    Attributes:
+        prefix (str): Output path prefix.
+        submissions (int): Submissions written, including earlier runs
+            when appending.
+        comments (int): Comments written, likewise.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        fmt: Literal['csv', 'jsonl'] = 'csv',
+        append: bool = False,
+        dedup: Optional[float] = None,
+        rollup: Optional[Literal['second', 'minute', 'hour', 'day']] = None,
+        submissions: int = 0,
+        comments: int = 0
+    ) -> None:
+        self.prefix = prefix
+        self.submissions = submissions
+        self.comments = comments
+        self._fmt = fmt
+        self._append = append
+        self._files: List[TextIO] = []
+        self._index = None
+        self._activity = None
+        self._clusters = None
+
+        if dedup is not None:
+            from ..nlp.dedup import NearDuplicateIndex
+
+            self._index_path = f'{prefix}-dedup.npz'
+            if append and os.path.exists(self._index_path):
+                self._index = NearDuplicateIndex.load(self._index_path)
+            else:
+                self._index = NearDuplicateIndex(threshold=dedup)
+        if rollup is not None:
+            from .rollup import RollupIndex
+
+            self._rollup_path = os.path.join(os.path.dirname(prefix), f'rollup-{rollup}.csv')
+            self._activity = RollupIndex.open(self._rollup_path, rollup)
+
+        writer_cls = DictWriter if fmt == 'csv' else JsonLinesWriter
+        try:
+            self._submissions = self._open(f'submissions.{fmt}', Submission.csv_fields(), writer_cls)
+            self._comments = self._open(f'comments.{fmt}', Comment.csv_fields(), writer_cls)
+            self._stigma = self._open('stigma.csv', STIGMA_HEADER, DictWriter)
+            if self._index is not None:
+                self._clusters = self._open('clusters.csv', ['ID', 'cluster'], DictWriter)
+        except BaseException:
+            self.close()
+            raise
+
+    def _open(self, name: str, fieldnames: List[str], cls):
+        path = f'{self.prefix}-{name}'
+        # A resumed run may add a file the first run didn't write (e.g.
+        # clusters.csv when `dedup` is turned on), which needs its header.
+        new = not self._append or not os.path.exists(path) or os.path.getsize(path) == 0
+        fp = open(path, 'a' if self._append else 'w', newline='' if cls is DictWriter else None)
+        self._files.append(fp)
+        writer = cls(CountingWriter(fp, name.split('.')[0]), fieldnames=fieldnames)
+        if new:
+            writer.writeheader()
+        return writer
+
+    def _tag(self, id: str, kind: Literal['Submission', 'Comment'], text: str) -> None:
+        row = stigma_row(id, kind)
+        if self._index is not None:
+            with REGISTRY.stage('dedup'):
+                cluster = self._index.add(row['ID'], text)
+            self._clusters.writerow({'ID': row['ID'], 'cluster': cluster})
+            if cluster != row['ID']:
+                REGISTRY.counter('duplicates_total', kind=kind).inc()
+                return
+        self._stigma.writerow(row)
+
+    def write_submission(self, sub: Submission) -> None:
+        """Writes a submission (not its comments) and its stigma row."""
+        params = sub.params(csv=self._fmt == 'csv', datefmt=DATE_FORMAT)
+        self._submissions.writerow(params)
+        self._tag(params['id'], 'Submission', f'{sub.title or ""} {sub.selftext or ""}')
+        self.submissions += 1
+        if self._activity is not None:
+            self._activity.add(
+                'submissions', sub.subreddit, sub.created_utc, sub.score, id=f'Submission {sub.id}'
+            )
+
+    def write_comment(self, c: Comment) -> None:
+        if self._activity is not None:
+            self._activity.add('comments', c.subreddit, c.created_utc, c.score, id=f'Comment {c.id}')
+        params = c.params(datefmt=DATE_FORMAT)
+        self._comments.writerow(params)
+        self._tag(params['id'], 'Comment', params['body'])
+        self.comments += 1
 
-        stg_file = open(
-            f'data/input/{after_date.strftime(DATE_FORMAT)}-{now.strftime(DATE_FORMAT)}-stigma.csv',
-            'w'
+    def flush(self) -> None:
+        """Flushes the files and saves the dedup index and rollup.
+
+        Call before writing a checkpoint, so a resumed run's index and
+        rollup match the posts it has already written.
+        """
+        for fp in self._files:
+            fp.flush()
+        if self._index is not None:
+            self._index.sync(self._index_path)
+        if self._activity is not None:
+            self._activity.save(self._rollup_path)
+
+    def close(self) -> None:
+        """Closes the files and saves the dedup index and rollup."""
+        for fp in self._files:
+            fp.close()
+        self._files = []
+        if self._index is not None:
+            self._index.save(self._index_path)
+        if self._activity is not None:
+            self._activity.save(self._rollup_path)
+
+
+def write_reports(prefix: str, prometheus_file: Optional[str], sinks: Sinks) -> None:
+    """Writes the run report (and Prometheus metrics) from ``metrics.REGISTRY``."""
+    with open(f'{prefix}-report.json', 'w') as report:
+        REGISTRY.write_report(
+            report, submissions=sinks.submissions, comments=sinks.comments
         )
-        stg_csv = DictWriter(stg_file, fieldnames=STIGMA_HEADER)
-        stg_csv.writeheader()
+    if prometheus_file:
+        with open(prometheus_file, 'w') as prom:
+            REGISTRY.write_prometheus(prom)
+
+
+def run_prefix(
+    output_dir: str,
+    subreddits: Sequence[str],
+    after: datetime,
+    before: datetime
+) -> str:
+    """Common path prefix of a run's output files (no colons, so portable)."""
+    return os.path.join(
+        output_dir,
+        f'{"+".join(subreddits)}-{after.strftime(FILE_DATE_FORMAT)}'
+        f'-{before.strftime(FILE_DATE_FORMAT)}'
+    )
+
+
+def _latest_checkpoint(
+    output_dir: str,
+    subreddits: Sequence[str],
+    after: Optional[datetime]
+) -> Optional[str]:
+    start = after.strftime(FILE_DATE_FORMAT) if after else '*'
+    pattern = f'{glob.escape("+".join(subreddits))}-{start}-*-checkpoint.json'
+    found = glob.glob(os.path.join(glob.escape(output_dir), pattern))
+    return max(found, key=os.path.getmtime) if found else None
+
 
-        submissions = query_submissions(
-            subreddit='SuicideWatch',
-            after=int(after_date.timestamp()),
-            size=500
+def scrape_until(
+    subreddits: Sequence[str] = ('SuicideWatch', ),
+    after: Optional[datetime] = None,
+    before: Optional[datetime] = None,
+    size: int = 500,
+    concurrency: int = 1,
+    output_dir: str = 'data/input',
+    fmt: Literal['csv', 'jsonl'] = 'csv',
+    resume: bool = False,
+    prometheus_file: Optional[str] = None,
+    archive_dir: Optional[str] = None,
+    dedup: Optional[float] = None,
+    rollup: Optional[Literal['second', 'minute', 'hour', 'day']] = None
+) -> str:
+    """Scrapes submissions and their comments in a time range to files.
+
+    Submissions and comments are written to ``<prefix>-submissions.<fmt>``
+    and ``<prefix>-comments.<fmt>``, with a blank ``<prefix>-stigma.csv``
+    row per post for tagging. After every Pushshift page the files are
+    flushed and ``<prefix>-checkpoint.json`` records the newest second
+    fully written (and the IDs written from it), so an interrupted run can
+    continue with `resume` instead of starting over. A JSON run report with
+    per-stage timings and counters from ``metrics.REGISTRY`` is written
+    beside the data once the run ends.
+
+    Args:
+        subreddits (Sequence[str], optional): Subreddits to scrape together.
+        after (datetime, optional): Start of the range (UTC); by default 30
+            days before `before`.
+        before (datetime, optional): End of the range (UTC); by default now.
+        size (int, optional): Submissions per Pushshift page.
+        concurrency (int, optional): Submissions whose comments are fetched
+            in parallel.
+        output_dir (str, optional): Created if missing.
+        fmt (str, optional): 'csv' or 'jsonl' for the submission and comment
+            files; the stigma sheet is always CSV.
+        resume (bool, optional): Continue an interrupted run from its
+            checkpoint, appending to its files. Without both `after` and
+            `before`, the newest run for these subreddits (and `after`, if
+            given) is continued over its original range.
+        prometheus_file (str, optional): If given, also dumps the metrics to
+            this path in the Prometheus text format.
+        archive_dir (str, optional): If given, every raw response page is
+            kept in a `RawArchive` there.
+        dedup (float, optional): If given, posts are clustered as they are
+            written by `nlp.dedup.NearDuplicateIndex` with this similarity
+            threshold. ``<prefix>-clusters.csv`` maps every post to its
+            cluster, and only each cluster's first post gets a stigma row.
+        rollup (str, optional): If given, per-subreddit activity in buckets
+            of this width is added to ``<output_dir>/rollup-<rollup>.csv``
+            (see `rollup.RollupIndex`), shared by every run in the directory;
+            posts already counted by another run aren't counted again.
+
+    Returns:
+        str: The output path prefix of the run.
+    """
+    checkpoint_path = None
+    if resume:
+        if after and before:
+            checkpoint_path = f'{run_prefix(output_dir, subreddits, after, before)}-checkpoint.json'
+        else:
+            # Without the full range, continue the newest matching run.
+            checkpoint_path = _latest_checkpoint(output_dir, subreddits, after)
+    resume = bool(checkpoint_path) and os.path.exists(checkpoint_path)
+
+    if resume:
+        with open(checkpoint_path, 'r') as f:
+            checkpoint = json.load(f)
+        prefix = checkpoint_path[:-len('-checkpoint.json')]
+        before = datetime.fromtimestamp(checkpoint['before'], timezone.utc)
+        print(f'Resuming {prefix} after {checkpoint["after"]}.')
+    else:
+        before = before or datetime.now(timezone.utc)
+        after = after or (before - timedelta(days=30))
+        prefix = run_prefix(output_dir, subreddits, after, before)
+        checkpoint_path = f'{prefix}-checkpoint.json'
+        checkpoint = {
+            'after': int(after.timestamp()),
+            'before': int(before.timestamp()),
+            'submissions': 0,
+            'comments': 0,
+        }
+    os.makedirs(output_dir, exist_ok=True)
+
+    REGISTRY.reset()
+    archive = RawArchive(archive_dir) if archive_dir else None
+    sinks = Sinks(
+        prefix, fmt, resume, dedup, rollup,
+        submissions=checkpoint['submissions'], comments=checkpoint['comments']
+    )
+    try:
+        pages = query_submissions(
+            subreddit=','.join(subreddits),
+            after=checkpoint['after'],
+            before=int(before.timestamp()),
+            size=size,
+            archive=archive,
+            concurrency=concurrency,
+            exclude_ids=checkpoint.get('ids'),
+            pages=True
         )
-        scount, ccount = 0, 0
-        for sub in submissions:
-            sparams = sub.params(csv=True, datefmt=DATE_FORMAT)
-            sub_csv.writerow(sparams)
-            stg_csv.writerow(stigma_row(sparams['id'], 'Submission'))
-            scount += 1
-            for c in sub.get_comments():
-                cparams = c.params(datefmt=DATE_FORMAT)
-                cmt_csv.writerow(cparams)
-                stg_csv.writerow(stigma_row(cparams['id'], 'Comment'))
-                ccount += 1
-            if scount % 250 == 0:
-                print(f'Wrote {scount} submissions and {ccount} comments.')
-        print(f'DONE. Wrote {scount} submissions and {ccount} comments.')
+        for page in pages:
+            with REGISTRY.stage('write'):
+                for sub in page:
+                    sinks.write_submission(sub)
+                    for c in sub.get_comments() or []:
+                        sinks.write_comment(c)
+                sinks.flush()
+                # Pushshift's `after` is exclusive: restart within the last
+                # second and skip the IDs already written from it.
+                last = int(page[-1].created_utc)
+                ids = {s.id for s in page if s.created_utc == last}
+                if checkpoint['after'] == last - 1:
+                    ids.update(checkpoint.get('ids', []))
+                checkpoint.update(
+                    after=last - 1,
+                    ids=sorted(ids),
+                    submissions=sinks.submissions,
+                    comments=sinks.comments
+                )
+                _write_checkpoint(checkpoint_path, checkpoint)
+            REGISTRY.records('write', sum(1 + len(s.get_comments() or []) for s in page))
+            print(f'Wrote {sinks.submissions} submissions and {sinks.comments} comments.')
+        print(f'DONE. Wrote {sinks.submissions} submissions and {sinks.comments} comments.')
     finally:
-        sub_file.close()
-        cmt_file.close()
-        stg_file.close()
+        sinks.close()
+        if archive is not None:
+            archive.close()
+        write_reports(prefix, prometheus_file, sinks)
+    return prefix
+
+
+def _write_checkpoint(path: str, state: dict) -> None:
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
 
 
 def clean_csvs(sub_file: str, cmt_file: str):
+    import pandas as pd
+
     cmt = pd.read_csv(cmt_file)
     sub = pd.read_csv(sub_file)
 